@@ -0,0 +1,140 @@
+"""Cache in-process delle risposte renderizzate (LRU + TTL).
+
+Il contenuto delle pagine cambia solo quando gira l'ingest o quando un admin
+modifica ads/offerte/attività: questi punti chiamano `invalidate_content()`,
+il TTL copre tutto il resto. Ogni voce porta il proprio ETag, così i browser
+possono rivalidare con If-None-Match e ricevere 304.
+
+Le cache sono per processo, ma l'ingest gira nel worker e uvicorn può avere
+più worker: `invalidate_content()` incrementa anche un contatore nel DB
+(`content_version`) e ogni processo lo rilegge con `sync_content_version()`
+al più ogni CONTENT_VERSION_CHECK secondi.
+"""
+import hashlib, os, threading, time
+from collections import OrderedDict
+from typing import Hashable
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from .db import engine, get_async_engine
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: bytes, ttl: float):
+        self.body = body
+        self.etag = 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+        self.expires_at = time.monotonic() + ttl
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 128, ttl: float = 60.0):
+        self.max_entries = max(max_entries, 1)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        # Incrementata a ogni invalidazione: un render iniziato prima non viene salvato
+        self.generation = 0
+        # Usata sia dagli handler async sia da quelli sync (threadpool di FastAPI)
+        self._lock = threading.Lock()
+        register_cache(self)
+
+    def get(self, key: Hashable) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, body: bytes, generation: int | None = None) -> CachedResponse:
+        entry = CachedResponse(body, self.ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+# Tutto ciò che deriva dai contenuti (risposte renderizzate, feed assemblati):
+# oggetti con un metodo invalidate()
+_caches: list = []
+
+def register_cache(cache) -> None:
+    _caches.append(cache)
+
+CONTENT_VERSION_CHECK = float(os.getenv("CONTENT_VERSION_CHECK", "2") or 0)
+_version_lock = threading.Lock()
+_seen_version: int | None = None
+_version_checked_at = 0.0
+_VERSION_SQL = text("SELECT version FROM content_version WHERE id = 1")
+
+def _invalidate_local() -> None:
+    for cache in _caches:
+        cache.invalidate()
+
+def _bump_content_version() -> int:
+    with engine.begin() as conn:
+        if not conn.execute(text("UPDATE content_version SET version = version + 1 WHERE id = 1")).rowcount:
+            conn.execute(text("INSERT INTO content_version (id, version) VALUES (1, 1)"))
+        return conn.execute(_VERSION_SQL).scalar_one()
+
+def invalidate_content() -> None:
+    """Svuota tutte le cache (di tutti i processi): da chiamare dopo ingest e modifiche admin."""
+    global _seen_version
+    _invalidate_local()
+    try:
+        version = _bump_content_version()
+    except (IntegrityError, OperationalError) as e:
+        # Gli altri processi si riallineano comunque entro il TTL
+        print(f"[WARN] content_version non aggiornata: {e}")
+        return
+    with _version_lock:
+        _seen_version = version
+
+def _version_check_due(now: float) -> bool:
+    return now - _version_checked_at >= CONTENT_VERSION_CHECK
+
+def _apply_version(version: int, now: float) -> None:
+    global _seen_version, _version_checked_at
+    with _version_lock:
+        _version_checked_at = now
+        if _seen_version is not None and version != _seen_version:
+            _invalidate_local()
+        _seen_version = version
+
+def sync_content_version() -> None:
+    """Svuota le cache locali se un altro processo ha modificato i contenuti."""
+    now = time.monotonic()
+    if not _version_check_due(now):
+        return
+    with engine.connect() as conn:
+        version = conn.execute(_VERSION_SQL).scalar() or 0
+    _apply_version(version, now)
+
+async def sync_content_version_async() -> None:
+    """Come `sync_content_version`, senza bloccare l'event loop (handler async)."""
+    now = time.monotonic()
+    if not _version_check_due(now):
+        return
+    async with get_async_engine().connect() as conn:
+        version = (await conn.execute(_VERSION_SQL)).scalar() or 0
+    _apply_version(version, now)
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+dashboard_cache = ResponseCache(
+    max_entries=int(os.getenv("DASHBOARD_CACHE_SIZE", "256") or 256),
+    ttl=float(os.getenv("DASHBOARD_CACHE_TTL", "300") or 300),
+)
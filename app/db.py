@@ -1,18 +1,133 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import ArgumentError, InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 import os
 from dotenv import load_dotenv
+from .metrics import instrument_engine
+from .profiling import profile_engine
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./localbrain.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Pragma SQLite per la produzione: WAL fa sì che le letture della dashboard non
+# si blocchino durante i commit dell'ingest (e viceversa), busy_timeout evita
+# gli errori "database is locked" quando API, ingest e bot scrivono insieme.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000") or 5000),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)) or 0),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536") or -2000),  # negativo = KiB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    connect_args={"check_same_thread": False, "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000} if IS_SQLITE else {},
 )
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if value == "" or value is None:
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+# Driver async per lo stesso DATABASE_URL (percorsi di lettura di API e bot)
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_url(url: str) -> str:
+    # Anche con il driver sync esplicito (sqlite+pysqlite, postgresql+psycopg2)
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme.partition("+")[0], scheme) + sep + rest
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "") or async_url(DATABASE_URL)
+
+def _is_sqlite_memory(url: str) -> bool:
+    scheme, _, rest = url.partition("://")
+    return scheme.startswith("sqlite") and (rest in {"", "/"} or ":memory:" in rest or "mode=memory" in rest)
+
+IS_SQLITE_FILE = IS_SQLITE and not _is_sqlite_memory(DATABASE_URL)
+
+if IS_SQLITE_FILE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+# Durata e numero delle query per /metrics (app/metrics.py); statement per richiesta se SQL_PROFILE
+instrument_engine(engine)
+profile_engine(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Il motore async si crea al primo uso (get_async_db, AsyncSessionLocal): script,
+# ingest e migrazioni usano solo quello sync e non hanno bisogno del driver async
+_async_engine: AsyncEngine | None = None
+
+def _create_async_engine() -> AsyncEngine:
+    scheme = ASYNC_DATABASE_URL.partition("://")[0]
+    # Un DB SQLite in memoria esiste solo nella connessione (o nel driver) che lo apre:
+    # il motore async (aiosqlite) ne vedrebbe uno suo, vuoto, diverso da quello sync.
+    # Per prove e benchmark si usa un file temporaneo
+    if _is_sqlite_memory(ASYNC_DATABASE_URL):
+        raise RuntimeError(
+            f"Database SQLite in memoria non supportato ({ASYNC_DATABASE_URL}): "
+            "API e bot leggono con il motore async, che aprirebbe un DB separato. Usa un file, es. sqlite:////tmp/localbrain.db"
+        )
+    # Con aiosqlite ogni connessione ha il suo thread: le query non passano dal
+    # threadpool di FastAPI, il limite è il pool (DB_ASYNC_POOL_SIZE + overflow).
+    # Per SQLite su file il default di SQLAlchemy sarebbe NullPool (una connessione
+    # nuova, e un thread, per ogni sessione): qui le connessioni si riusano
+    pool = {
+        "pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", "10") or 10),
+        "max_overflow": int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "20") or 0),
+    }
+    if IS_SQLITE_FILE:
+        pool["poolclass"] = AsyncAdaptedQueuePool
+    elif IS_SQLITE:
+        pool = {}
+    try:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            connect_args={"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000} if IS_SQLITE else {},
+            **pool,
+        )
+    except ImportError as e:
+        raise RuntimeError(f"Driver async non installato per {scheme} ({e}): installalo o imposta ASYNC_DATABASE_URL") from e
+    except (ArgumentError, InvalidRequestError) as e:
+        # Schema sconosciuto o driver solo sync (es. mysql://): l'API non può partire, gli script sync sì
+        raise RuntimeError(f"Nessun driver async per {scheme}: imposta ASYNC_DATABASE_URL (es. postgresql+asyncpg://...)") from e
+    if IS_SQLITE_FILE:
+        event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    instrument_engine(async_engine.sync_engine)
+    profile_engine(async_engine.sync_engine)
+    return async_engine
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = _create_async_engine()
+    return _async_engine
+
+async def dispose_async_engine() -> None:
+    """Chiude le connessioni del motore async, se è stato creato.
+
+    Le connessioni aiosqlite hanno ciascuna un thread non daemon: senza questa
+    chiamata un processo che le ha usate non termina.
+    """
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+# expire_on_commit=False: gli oggetti restano leggibili dopo il commit senza lazy load (vietato in async)
+_async_sessions = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def AsyncSessionLocal() -> AsyncSession:
+    return _async_sessions(bind=get_async_engine())
+
 class Base(DeclarativeBase):
     pass
 
@@ -22,3 +137,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,218 @@
+"""Feed già assemblato (item + sponsor) per `(città, categoria)`.
+
+`/items`, `/dashboard` e il bot leggono la stessa struttura: le righe più
+recenti (fino a FEED_WINDOW) già serializzate e la sequenza degli sponsor
+per slot. Si costruisce alla prima richiesta dopo una modifica dei contenuti
+e resta valida finché `invalidate_content()` (ingest, admin) non la scarta,
+quindi una pagina costa una bisezione sul cursore più una slice.
+
+Gli sponsor si alternano con un round-robin pesato "smooth" su `Ad.weight`
+(con pesi 3 e 1 il primo occupa tre slot su quattro, senza raffiche
+consecutive; peso 0 = fuori dal feed). La sequenza è la stessa per ogni città
+e categoria: si calcola una volta (`feed_ads`) e la condividono tutti i feed e
+il bot. Oltre la finestra materializzata le pagine si leggono dal DB come
+prima; la posizione nel feed, che decide lo sponsor di ogni slot, viaggia nel
+cursore.
+"""
+import os, threading, time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import register_cache
+from .models import Ad, Item
+from .pagination import cursor_position, decode_cursor, encode_cursor, paginate_async
+
+FEED_AD_FREQUENCY = max(int(os.getenv("FEED_AD_FREQUENCY", "3") or 3), 1)
+# Item per feed tenuti in memoria (le pagine più profonde vanno al DB)
+FEED_WINDOW = max(int(os.getenv("FEED_WINDOW", "1000") or 1000), 1)
+FEED_CACHE_SIZE = max(int(os.getenv("FEED_CACHE_SIZE", "64") or 64), 1)
+FEED_TTL = float(os.getenv("FEED_TTL", "300") or 300)
+
+_ITEM_COLUMNS = (
+    Item.id, Item.title, Item.url, Item.summary, Item.source, Item.city,
+    Item.category, Item.published_at, Item.score, Item.image_url,
+)
+
+def weighted_round_robin(entries: list, weights: list[float], length: int) -> list:
+    """Sequenza di `length` elementi con frequenze proporzionali ai pesi (smooth WRR, come nginx)."""
+    pairs = [(entry, float(w)) for entry, w in zip(entries, weights) if w and w > 0]
+    if not pairs:
+        return []
+    total = sum(w for _, w in pairs)
+    current = [0.0] * len(pairs)
+    out = []
+    for _ in range(length):
+        best = 0
+        for i, (_, w) in enumerate(pairs):
+            current[i] += w
+            if current[i] > current[best]:
+                best = i
+        current[best] -= total
+        out.append(pairs[best][0])
+    return out
+
+def interleave(records: list, ads: list, every: int, start: int = 0) -> list[dict]:
+    """Uno sponsor dopo ogni `every` item; `start` è la posizione del primo record nel feed.
+
+    Lo slot k (k-esimo sponsor dall'inizio del feed) usa `ads[k % len(ads)]`,
+    così la rotazione prosegue tra una pagina e l'altra.
+    """
+    out = []
+    for position, record in enumerate(records, start=start + 1):
+        out.append({"type": "item", "record": record})
+        if ads and position % every == 0:
+            out.append({"type": "ad", "record": ads[(position // every - 1) % len(ads)]})
+    return out
+
+def _item_dict(item) -> dict:
+    return {column.key: getattr(item, column.key) for column in _ITEM_COLUMNS}
+
+def _filtered(stmt, city: str | None, category: str | None):
+    if city:
+        stmt = stmt.where(Item.city.ilike(f"%{city}%"))
+    if category:
+        stmt = stmt.where(Item.category == category)
+    return stmt
+
+def _ad_dict(ad: Ad) -> dict:
+    return {
+        "id": ad.id,
+        "title": ad.title,
+        "url": ad.url,
+        "message": ad.message,
+        "category": ad.category,
+        "city": ad.city,
+        "image_url": ad.image_url,
+    }
+
+class Feed:
+    __slots__ = ("items", "ads", "complete", "expires_at", "_asc_keys")
+
+    def __init__(self, items: list[dict], ads: list[dict], complete: bool, ttl: float):
+        self.items = items
+        self.ads = ads
+        # False se la finestra è piena: oltre l'ultimo item potrebbero essercene altri nel DB
+        self.complete = complete
+        self.expires_at = time.monotonic() + ttl
+        self._asc_keys = [(it["published_at"] or datetime.min, it["id"]) for it in reversed(items)]
+
+    def start_of(self, cursor: tuple[datetime, int] | None) -> int:
+        """Indice del primo item dopo il cursore (ordine published_at DESC, id DESC)."""
+        if cursor is None:
+            return 0
+        return len(self.items) - bisect_left(self._asc_keys, cursor)
+
+    def page(self, cursor: tuple[datetime, int] | None, limit: int) -> tuple[int, list[dict], bool] | None:
+        """(posizione iniziale, item, c'è altro); None se la pagina esce dalla finestra."""
+        start = self.start_of(cursor)
+        end = start + limit
+        if end >= len(self.items) and not self.complete:
+            return None
+        return start, self.items[start:end], end < len(self.items)
+
+class FeedStore:
+    def __init__(self, max_entries: int = FEED_CACHE_SIZE, ttl: float = FEED_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple[str, str], Feed]" = OrderedDict()
+        # Sequenza degli sponsor (comune a tutti i feed) e sua scadenza
+        self._ads: tuple[list[dict], float] | None = None
+        self.generation = 0
+        self._lock = threading.Lock()
+        register_cache(self)
+
+    def get(self, key: tuple[str, str]) -> Feed | None:
+        with self._lock:
+            feed = self._entries.get(key)
+            if feed is None:
+                return None
+            if feed.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return feed
+
+    def set(self, key: tuple[str, str], feed: Feed, generation: int) -> None:
+        with self._lock:
+            # Costruito prima di un'invalidazione: si usa per questa richiesta ma non si salva
+            if generation != self.generation:
+                return
+            self._entries[key] = feed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_ads(self) -> list[dict] | None:
+        with self._lock:
+            if self._ads is None or self._ads[1] <= time.monotonic():
+                return None
+            return self._ads[0]
+
+    def set_ads(self, ads: list[dict], generation: int) -> None:
+        with self._lock:
+            if generation == self.generation:
+                self._ads = (ads, time.monotonic() + self.ttl)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._ads = None
+
+feeds = FeedStore()
+
+async def feed_ads(db: AsyncSession) -> list[dict]:
+    """Sequenza pesata degli sponsor del feed, senza leggere gli item (la usa anche il bot)."""
+    ads = feeds.get_ads()
+    if ads is None:
+        generation = feeds.generation
+        rows = (await db.scalars(
+            select(Ad).where(Ad.active == True, Ad.show_in_feed == True).order_by(Ad.created_at.desc())
+        )).all()
+        # Uno slot per item della finestra basta per qualsiasi `every`; oltre si ricomincia (ads[k % len])
+        ads = weighted_round_robin([_ad_dict(ad) for ad in rows], [ad.weight for ad in rows], FEED_WINDOW)
+        feeds.set_ads(ads, generation)
+    return ads
+
+def window_statement(city: str | None, category: str | None):
+    """Query degli item materializzati di un feed (verificata da scripts/check_query_plans.py)."""
+    return _filtered(select(*_ITEM_COLUMNS), city, category).order_by(Item.published_at.desc(), Item.id.desc()).limit(FEED_WINDOW)
+
+async def build_feed(db: AsyncSession, city: str | None, category: str | None) -> Feed:
+    items = [dict(row) for row in (await db.execute(window_statement(city, category))).mappings()]
+    return Feed(items, await feed_ads(db), len(items) < FEED_WINDOW, feeds.ttl)
+
+async def get_feed(db: AsyncSession, city: str | None = None, category: str | None = None) -> Feed:
+    key = ((city or "").strip().lower(), category or "")
+    feed = feeds.get(key)
+    if feed is None:
+        generation = feeds.generation
+        feed = await build_feed(db, key[0], key[1])
+        feeds.set(key, feed, generation)
+    return feed
+
+async def _position_after(db: AsyncSession, city: str | None, category: str | None, after: tuple[datetime, int]) -> int:
+    # Item fino al cursore compreso (già mostrati): serve solo per cursori senza posizione
+    stmt = _filtered(select(func.count()).select_from(Item), city, category)
+    stmt = stmt.where(tuple_(Item.published_at, Item.id) >= tuple_(*after))
+    return (await db.execute(stmt)).scalar_one()
+
+async def feed_page(db: AsyncSession, city: str | None, category: str | None, cursor: str | None, limit: int) -> tuple[Feed, int, list[dict], str | None]:
+    """Pagina keyset del feed: (feed, posizione del primo item, item, cursore successivo)."""
+    feed = await get_feed(db, city, category)
+    after = decode_cursor(cursor) if cursor else None
+    page = feed.page(after, limit)
+    if page is None:
+        # Oltre la finestra in memoria: keyset sul DB, con le stesse regole di ordinamento
+        rows, db_cursor = await paginate_async(db, _filtered(select(Item), city, category), Item.published_at, Item.id, cursor, limit)
+        records, more = [_item_dict(row) for row in rows], db_cursor is not None
+        start = cursor_position(cursor) if cursor else 0
+        if start is None:
+            start = await _position_after(db, city, category, after)
+    else:
+        start, records, more = page
+    # Il cursore porta la posizione assoluta: le pagine oltre la finestra proseguono la rotazione
+    next_cursor = encode_cursor(records[-1]["published_at"], records[-1]["id"], start + len(records)) if more and records else None
+    return feed, start, records, next_cursor
@@ -0,0 +1,109 @@
+"""Coda dei job su DB (tabella `jobs`).
+
+Il processo web si limita ad accodare; i job li esegue il worker leader
+(`python -m scripts.worker`), uno alla volta, nell'ordine di arrivo. Per
+ogni tipo c'è al più un job attivo (in coda o in esecuzione): un trigger
+che arriva mentre ce n'è già uno riceve quello esistente.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models import Job
+
+ACTIVE_STATUSES = ("queued", "running")
+
+def _active_job(db: Session, kind: str) -> Job | None:
+    return db.query(Job).filter(Job.kind == kind, Job.status.in_(ACTIVE_STATUSES)).first()
+
+def enqueue_job(db: Session, kind: str, trigger: str = "manual") -> tuple[Job, bool]:
+    """Accoda un job; restituisce (job, creato). Se ne esiste già uno attivo, restituisce quello."""
+    existing = _active_job(db, kind)
+    if existing is not None:
+        return existing, False
+    job = Job(kind=kind, trigger=trigger, status="queued", created_at=datetime.utcnow())
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Un altro processo l'ha accodato nello stesso istante (indice ux_jobs_active_kind)
+        db.rollback()
+        existing = _active_job(db, kind)
+        if existing is None:
+            raise
+        return existing, False
+    db.refresh(job)
+    return job, True
+
+def claim_next_job(db: Session, worker: str) -> Job | None:
+    """Prende il job in coda più vecchio; l'UPDATE condizionato evita che due worker prendano lo stesso."""
+    job = db.query(Job).filter(Job.status == "queued").order_by(Job.created_at, Job.id).first()
+    if job is None:
+        return None
+    claimed = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "queued")
+        .values(status="running", worker=worker, started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow())
+    ).rowcount
+    db.commit()
+    if not claimed:
+        return None
+    db.refresh(job)
+    return job
+
+def finish_job(db: Session, job: Job, result: dict | None = None, error: str | None = None) -> None:
+    job.status = "failed" if error else "done"
+    job.result = error if error else json.dumps(result or {}, default=str)
+    job.finished_at = datetime.utcnow()
+    db.commit()
+
+def update_progress(db: Session, job_id: int, progress: dict) -> None:
+    db.execute(update(Job).where(Job.id == job_id).values(progress=json.dumps(progress, default=str)))
+    db.commit()
+
+def job_as_dict(job: Job) -> dict:
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "trigger": job.trigger,
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "progress": json.loads(job.progress) if job.progress else None,
+        "result": None,
+        "error": None,
+    }
+    if job.status == "failed":
+        data["error"] = job.result
+    elif job.result:
+        data["result"] = json.loads(job.result)
+    return data
+
+def heartbeat_job(db: Session, job_id: int, worker: str) -> bool:
+    """Segnala che `worker` sta ancora eseguendo il job; False se non è più suo o non è più in esecuzione."""
+    alive = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.worker == worker, Job.status == "running")
+        .values(heartbeat_at=datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return bool(alive)
+
+def fail_orphaned_jobs(db: Session, worker: str, stale_before: datetime) -> int:
+    """Job `running` di un altro worker senza heartbeat da prima di `stale_before`: chiusi come falliti.
+
+    Un worker vivo che perde il lease interrompe da solo il suo job: finché
+    l'heartbeat è recente il job si lascia stare anche se il lease è già di un
+    altro, così resta l'unico attivo del suo tipo e `/admin/ingest-now` non ne
+    accoda un secondo mentre il primo scrive ancora.
+    """
+    count = db.execute(
+        update(Job)
+        .where(Job.status == "running", Job.worker != worker,
+               func.coalesce(Job.heartbeat_at, Job.started_at, Job.created_at) < stale_before)
+        .values(status="failed", result="Interrotto: il worker è terminato durante l'esecuzione", finished_at=datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return count
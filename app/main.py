@@ -2,34 +2,46 @@ import os
 import asyncio
 from datetime import datetime, date
 from fastapi import FastAPI, Depends, Query, Request, Header, HTTPException, Form, status
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from .db import Base, engine, get_db
-from .models import Item, Ad, ServiceOffer, LocalBusiness, AdRequest
+from .cache import dashboard_cache, etag_matches, invalidate_content, sync_content_version_async
+from .db import Base, dispose_async_engine, engine, get_async_db, get_db
+from .feed import FEED_AD_FREQUENCY, feed_ads, feed_page, interleave
+from .jobs import enqueue_job, job_as_dict
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, render as render_metrics
+from .migrations import run_migrations
+from .models import Item, Ad, ServiceOffer, LocalBusiness, AdRequest, Job
+from .profiling import SQL_PROFILE, SQL_REPEAT_THRESHOLD, SQL_SLOW_MS, ProfilingMiddleware, recent_profiles
+from .pagination import MAX_PAGE_SIZE, paginate_async, set_next_cursor
+from .stats import admin_stats, invalidate_stats
+from .search import SCOPES as SEARCH_SCOPES, search as run_search
 from .ranking import KEYWORDS
-from scripts.ingest import ingest
+from .sources.crawlers import close_client, shutdown_parse_pool
+from scripts.worker import run_worker
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(title="LocalBrain API", version="0.1.0")
 templates = Jinja2Templates(directory="app/templates")
+app.add_middleware(MetricsMiddleware)
+if SQL_PROFILE:
+    app.add_middleware(ProfilingMiddleware)
 
 # Serve static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Scheduler per ingest automatico
-scheduler = AsyncIOScheduler()
-scheduler.add_job(
-    ingest,
-    trigger=CronTrigger(minute="0"),  # Esegue ogni ora
-    id="hourly_ingest",
-    replace_existing=True
-)
+# L'ingest orario gira nel worker dedicato (python -m scripts.worker). Per le
+# installazioni a processo singolo il web può ospitarlo: con più worker uvicorn
+# il lease nel DB garantisce comunque un solo scheduler attivo
+WEB_SCHEDULER = os.getenv("WEB_SCHEDULER", "false").lower() in {"1", "true", "yes"}
+_worker_stop = asyncio.Event()
+_worker_task: asyncio.Task | None = None
 
 SERVICE_CATEGORIES = [
     ("pulizie", "Pulizie domestiche"),
@@ -55,15 +67,22 @@ BUSINESS_CATEGORIES = [
 
 @app.on_event("startup")
 async def startup_event():
-    """Avvia lo scheduler all'avvio dell'app"""
-    scheduler.start()
-    print("✅ Scheduler avviato - ingest automatico ogni ora")
+    """Avvia il worker di ingest nel processo web, se richiesto"""
+    global _worker_task
+    if WEB_SCHEDULER:
+        _worker_task = asyncio.create_task(run_worker(_worker_stop))
+        print("✅ Scheduler avviato nel processo web - polling adattivo delle fonti")
 
 @app.on_event("shutdown")
-def shutdown_event():
-    """Ferma lo scheduler alla chiusura"""
-    scheduler.shutdown()
-    print("❌ Scheduler fermato")
+async def shutdown_event():
+    """Ferma il worker (se attivo), chiude la sessione HTTP dei crawler e il pool async del DB"""
+    if _worker_task is not None:
+        _worker_stop.set()
+        await _worker_task
+        print("❌ Scheduler fermato")
+    await close_client()
+    shutdown_parse_pool()
+    await dispose_async_engine()
 
 @app.get("/")
 def root():
@@ -75,103 +94,147 @@ def root():
 def health():
     return {"status": "ok"}
 
-@app.post("/admin/ingest-now")
-async def ingest_now():
-    """Trigger manuale per ingest"""
-    try:
-        await ingest()
-        return {"status": "success", "message": "Ingest completato"}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+@app.get("/metrics")
+def metrics():
+    """Metriche del processo in formato Prometheus (latenze per route, query SQL; ingest se WEB_SCHEDULER)"""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/admin/ingest-now", status_code=status.HTTP_202_ACCEPTED)
+def ingest_now(db: Session = Depends(get_db)):
+    """Accoda un ingest (lo esegue il worker leader); se ce n'è già uno attivo restituisce quello"""
+    job, created = enqueue_job(db, "ingest")
+    # Risorsa admin: si legge con l'header X-Admin-Token (se ADMIN_TOKEN è impostato)
+    status_url = f"/admin/jobs/{job.id}"
+    return JSONResponse(
+        {
+            "status": job.status,
+            "job_id": job.id,
+            "deduplicated": not created,
+            "status_url": status_url,
+            "message": "Ingest accodato" if created else "Ingest già in corso",
+        },
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": status_url},
+    )
 
+@app.get("/admin/jobs/{job_id}")
+async def job_status(
+    job_id: int,
+    admin_token: str | None = Header(None, alias="X-Admin-Token"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stato, avanzamento per fonte e risultato di un job"""
+    env_token = os.getenv("ADMIN_TOKEN", "")
+    _check_admin(admin_token, env_token)
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return job_as_dict(job)
+
+# Gli endpoint di lettura più chiamati (/items, /search, /dashboard, /api/*) sono
+# async su AsyncSession: la concorrenza non è limitata dal threadpool di FastAPI.
+# Le scritture (admin, form) restano sync su get_db.
 @app.get("/items")
-def list_items(
+async def list_items(
+    request: Request,
+    response: Response,
     city: str | None = Query(None),
     category: str | None = Query(None),
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
     include_ads: bool = Query(False),
     every: int = Query(3, ge=1),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(Item).order_by(Item.published_at.desc())
-    if city:
-        q = q.filter(Item.city.ilike(f"%{city}%"))
-    if category:
-        q = q.filter(Item.category == category)
-    items = [{
-        "type": "item",
-        "id": i.id,
-        "title": i.title,
-        "url": i.url,
-        "summary": i.summary,
-        "source": i.source,
-        "city": i.city,
-        "category": i.category,
-        "published_at": i.published_at.isoformat() if i.published_at else None,
-        "score": i.score,
-        "image_url": i.image_url
-    } for i in q.limit(limit).all()]
-
-    if not include_ads or not items:
-        return items
-
-    ads = (
-        db.query(Ad)
-        .filter(Ad.active == True, Ad.show_in_feed == True)
-        .order_by(Ad.created_at.desc())
-        .all()
-    )
-    if not ads:
-        return items
-
-    enriched = []
-    ad_index = 0
-    for idx, it in enumerate(items, start=1):
-        enriched.append(it)
-        if idx % every == 0:
-            ad = ads[ad_index % len(ads)]
-            enriched.append({
+    # Feed già assemblato in memoria (app/feed.py): la pagina è una slice
+    await sync_content_version_async()
+    feed, start, rows, next_cursor = await feed_page(db, city, category, cursor, limit)
+    set_next_cursor(request, response, next_cursor)
+    entries = interleave(rows, feed.ads if include_ads else [], every, start)
+    out = []
+    for entry in entries:
+        record = entry["record"]
+        if entry["type"] == "item":
+            out.append({
+                "type": "item",
+                **{k: record[k] for k in ("id", "title", "url", "summary", "source", "city", "category")},
+                "published_at": record["published_at"].isoformat() if record["published_at"] else None,
+                "score": record["score"],
+                "image_url": record["image_url"],
+            })
+        else:
+            out.append({
                 "type": "ad",
-                "title": ad.title,
-                "url": ad.url,
-                "message": ad.message,
+                "title": record["title"],
+                "url": record["url"],
+                "message": record["message"],
                 "sponsor": True,
-                "category": ad.category,
-                "city": ad.city,
-                "image_url": ad.image_url,
+                "category": record["category"],
+                "city": record["city"],
+                "image_url": record["image_url"],
             })
-            ad_index += 1
-    return enriched
+    return out
+
+@app.get("/search")
+async def search_api(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: str = Query("all"),
+    city: str | None = Query(None),
+    category: str | None = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    prefix: bool | None = Query(None, description="true mentre l'utente digita (es. autocompletamento)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ricerca full-text (FTS5, ranking BM25, prefissi, snippet con <mark>)"""
+    if scope == "all":
+        scopes = SEARCH_SCOPES
+    elif scope in SEARCH_SCOPES:
+        scopes = (scope,)
+    else:
+        raise HTTPException(status_code=400, detail="Scope non valido")
+    # app/search.py è scritto per Session: run_sync lo esegue sulla connessione async
+    results = await db.run_sync(run_search, q, scopes, limit, city, category, prefix)
+    for hit in results.get("items", []):
+        hit["published_at"] = hit["published_at"].isoformat() if hit["published_at"] else None
+    return {"query": q, **results}
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(
+async def dashboard(
     request: Request,
     city: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
     limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db)
+    q: Optional[str] = Query(None, max_length=200),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(Item).order_by(Item.published_at.desc())
-    if city:
-        q = q.filter(Item.city.ilike(f"%{city}%"))
-    if category:
-        q = q.filter(Item.category == category)
-    raw_items = q.limit(limit).all()
-
-    all_ads = db.query(Ad).filter(Ad.active == True).order_by(Ad.created_at.desc()).all()
-
-    ads = [ad for ad in all_ads if ad.show_in_feed]
-    every = max(int(os.getenv("FEED_AD_FREQUENCY", "3") or 3), 1)
+    # Pagina più visitata: si serve dalla cache finché ingest/admin non la invalidano
+    await sync_content_version_async()
+    q = (q or "").strip()
+    cache_key = (city or "", category or "", limit, q)
+    cached = dashboard_cache.get(cache_key)
+    if cached is None:
+        generation = dashboard_cache.generation
+        rendered = await _render_dashboard(request, city, category, limit, q, db)
+        cached = dashboard_cache.set(cache_key, rendered.body, generation)
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return HTMLResponse(cached.body, headers=headers)
+
+async def _render_dashboard(request: Request, city: Optional[str], category: Optional[str], limit: int, search_query: str, db: AsyncSession):
+    if search_query:
+        # Ricerca full-text: risultati per rilevanza BM25, con evidenziazione
+        ads = await feed_ads(db)
+        raw_items = (await db.run_sync(run_search, search_query, ("items",), limit, city, category))["items"]
+    else:
+        feed, _, raw_items, _ = await feed_page(db, city, category, None, limit)
+        ads = feed.ads
+    combined = interleave(raw_items, ads, FEED_AD_FREQUENCY)
 
-    combined = []
-    ad_index = 0
-    for idx, item in enumerate(raw_items, start=1):
-        combined.append({"type": "item", "record": item})
-        if ads and idx % every == 0:
-            combined.append({"type": "ad", "record": ads[ad_index % len(ads)]})
-            ad_index += 1
+    # Banner laterali: tutti gli sponsor attivi, anche quelli fuori dal feed
+    all_ads = (await db.scalars(select(Ad).where(Ad.active == True).order_by(Ad.created_at.desc()))).all()
 
-    city_rows = db.query(Item.city).distinct().all()
+    city_rows = (await db.execute(select(Item.city).distinct())).all()
     available_cities = sorted({row[0] for row in city_rows if row[0]})
     categories = sorted({*KEYWORDS.keys(), "altro"})
 
@@ -186,43 +249,59 @@ def dashboard(
 
     items_view = []
     for entry in combined:
-        if entry["type"] == "item":
+        if entry["type"] == "item" and "snippet_html" in entry["record"]:
+            hit = entry["record"]
+            items_view.append({
+                "type": "item",
+                "id": hit["id"],
+                "title": hit["title"],
+                "title_html": hit["title_html"],
+                "url": hit["url"],
+                "summary_html": hit["snippet_html"],
+                "source": hit["source"],
+                "city": hit["city"],
+                "category": hit["category"],
+                "published_at": hit["published_at"].strftime("%d/%m/%Y %H:%M") if hit["published_at"] else "",
+                "image_url": hit["image_url"],
+            })
+        elif entry["type"] == "item":
             i = entry["record"]
             items_view.append({
                 "type": "item",
-                "id": i.id,
-                "title": i.title,
-                "url": i.url,
-                "summary": summarize(i.summary),
-                "source": i.source,
-                "city": i.city,
-                "category": i.category,
-                "published_at": i.published_at.strftime("%d/%m/%Y %H:%M") if i.published_at else "",
-                "image_url": i.image_url,
+                "id": i["id"],
+                "title": i["title"],
+                "url": i["url"],
+                "summary": summarize(i["summary"]),
+                "source": i["source"],
+                "city": i["city"],
+                "category": i["category"],
+                "published_at": i["published_at"].strftime("%d/%m/%Y %H:%M") if i["published_at"] else "",
+                "image_url": i["image_url"],
             })
         else:
             ad = entry["record"]
             items_view.append({
                 "type": "ad",
-                "title": ad.title,
-                "url": ad.url,
-                "message": ad.message,
-                "category": ad.category,
-                "city": ad.city,
-                "image_url": ad.image_url,
+                "title": ad["title"],
+                "url": ad["url"],
+                "message": ad["message"],
+                "category": ad["category"],
+                "city": ad["city"],
+                "image_url": ad["image_url"],
             })
 
     return templates.TemplateResponse(
         "dashboard.html",
         {
             "request": request,
-            "featured_offers": [_serialize_offer(o) for o in _get_highlighted_offers(db)],
+            "featured_offers": [_serialize_offer(o) for o in await _get_highlighted_offers(db)],
             "items": items_view,
             "cities": available_cities,
             "categories": categories,
             "selected_city": city or "",
             "selected_category": category or "",
             "limit": limit,
+            "search_query": search_query,
             "generated_at": datetime.utcnow().strftime("%d/%m/%Y %H:%M"),
             "sidebar_ads": _build_sidebar_ads(all_ads),
         }
@@ -269,14 +348,13 @@ def _serialize_offer(offer: ServiceOffer) -> dict:
         "created_at": offer.created_at.isoformat() if offer.created_at else None,
     }
 
-def _get_highlighted_offers(db: Session, limit: int = 3):
-    return (
-        db.query(ServiceOffer)
-        .filter(ServiceOffer.status == "published")
+async def _get_highlighted_offers(db: AsyncSession, limit: int = 3):
+    return (await db.scalars(
+        select(ServiceOffer)
+        .where(ServiceOffer.status == "published")
         .order_by(ServiceOffer.highlighted.desc(), ServiceOffer.created_at.desc())
         .limit(limit)
-        .all()
-    )
+    )).all()
 def _build_sidebar_ads(all_ads: list[Ad]):
     def serialize(ad: Ad | None):
         if not ad:
@@ -402,6 +480,7 @@ def create_ad(
     db.add(ad)
     db.commit()
     db.refresh(ad)
+    invalidate_content()
     return {"status": "ok", "id": ad.id}
 
 @app.delete("/ads/{ad_id}")
@@ -417,6 +496,7 @@ def delete_ad(
         raise HTTPException(status_code=404, detail="Ad non trovato")
     db.delete(ad)
     db.commit()
+    invalidate_content()
     return {"status": "ok"}
 
 
@@ -493,6 +573,7 @@ def create_offer(
     db.add(offer)
     db.commit()
     db.refresh(offer)
+    invalidate_content()
     return templates.TemplateResponse(
         "offer_submitted.html",
         {
@@ -503,21 +584,25 @@ def create_offer(
     )
 
 @app.get("/api/offers")
-def api_offers(
+async def api_offers(
+    request: Request,
+    response: Response,
     status_filter: str = Query("published"),
     category: str | None = Query(None),
     city: str | None = Query(None),
-    limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(ServiceOffer).order_by(ServiceOffer.created_at.desc())
+    stmt = select(ServiceOffer)
     if status_filter:
-        q = q.filter(ServiceOffer.status == status_filter)
+        stmt = stmt.where(ServiceOffer.status == status_filter)
     if category:
-        q = q.filter(ServiceOffer.category == category)
+        stmt = stmt.where(ServiceOffer.category == category)
     if city:
-        q = q.filter(ServiceOffer.city.ilike(f"%{city}%"))
-    offers = q.limit(limit).all()
+        stmt = stmt.where(ServiceOffer.city.ilike(f"%{city}%"))
+    offers, next_cursor = await paginate_async(db, stmt, ServiceOffer.created_at, ServiceOffer.id, cursor, limit)
+    set_next_cursor(request, response, next_cursor)
     return [_serialize_offer(o) for o in offers]
 
 @app.post("/offers/{offer_id}/status")
@@ -540,6 +625,7 @@ def update_offer_status(
     if highlight is not None:
         offer.highlighted = highlight.lower() == "true"
     db.commit()
+    invalidate_content()
     return {"status": "ok"}
 
 @app.get("/admin/offers", response_class=HTMLResponse)
@@ -636,6 +722,7 @@ def create_business(
     db.add(biz)
     db.commit()
     db.refresh(biz)
+    invalidate_content()
     if "text/html" in request.headers.get("accept", ""):
         return templates.TemplateResponse(
             "business_submitted.html",
@@ -645,18 +732,23 @@ def create_business(
     return {"status": "ok", "id": biz.id}
 
 @app.get("/api/businesses")
-def api_businesses(
+async def api_businesses(
+    request: Request,
+    response: Response,
     category: str | None = Query(None),
     city: str | None = Query(None),
-    limit: int = Query(50, ge=1, le=200),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(LocalBusiness).order_by(LocalBusiness.created_at.desc())
+    stmt = select(LocalBusiness)
     if category:
-        q = q.filter(LocalBusiness.category == category)
+        stmt = stmt.where(LocalBusiness.category == category)
     if city:
-        q = q.filter(LocalBusiness.city.ilike(f"%{city}%"))
-    return [_serialize_business(b) for b in q.limit(limit).all()]
+        stmt = stmt.where(LocalBusiness.city.ilike(f"%{city}%"))
+    businesses, next_cursor = await paginate_async(db, stmt, LocalBusiness.created_at, LocalBusiness.id, cursor, limit)
+    set_next_cursor(request, response, next_cursor)
+    return [_serialize_business(b) for b in businesses]
 
 @app.get("/admin/businesses", response_class=HTMLResponse)
 def admin_businesses(
@@ -719,6 +811,7 @@ def update_business(
     biz.image_url = image_url.strip()
     biz.highlighted = highlighted.lower() == "true"
     db.commit()
+    invalidate_content()
     return {"status": "ok"}
 
 @app.delete("/businesses/{biz_id}")
@@ -734,6 +827,7 @@ def delete_business(
         raise HTTPException(status_code=404, detail="Attività non trovata")
     db.delete(biz)
     db.commit()
+    invalidate_content()
     return {"status": "ok"}
 
 @app.post("/offers/{offer_id}/update")
@@ -775,6 +869,7 @@ def update_offer(
     offer.status = status_value
     offer.highlighted = highlighted.lower() == "true"
     db.commit()
+    invalidate_content()
     return {"status": "ok"}
 
 @app.delete("/offers/{offer_id}")
@@ -790,6 +885,7 @@ def delete_offer(
         raise HTTPException(status_code=404, detail="Offerta non trovata")
     db.delete(offer)
     db.commit()
+    invalidate_content()
     return {"status": "ok"}
 
 # Endpoint per richieste pubblicità
@@ -823,6 +919,8 @@ def create_ad_request(
     db.add(ad_request)
     db.commit()
     db.refresh(ad_request)
+    # Cambia solo il contatore pending_ads di /admin: feed e dashboard restano in cache
+    invalidate_stats()
 
     return templates.TemplateResponse(
         "ad_request_submitted.html",
@@ -853,15 +951,8 @@ def admin_dashboard(
     else:
         token = ""
 
-    # Statistiche per la dashboard
-    pending_ads_count = db.query(AdRequest).filter(AdRequest.status == "pending").count()
-    active_ads_count = db.query(Ad).filter(Ad.active == True).count()
-    pending_offers_count = db.query(ServiceOffer).filter(ServiceOffer.status == "pending").count()
-    published_offers_count = db.query(ServiceOffer).filter(ServiceOffer.status == "published").count()
-    businesses_count = db.query(LocalBusiness).count()
-    highlighted_businesses_count = db.query(LocalBusiness).filter(LocalBusiness.highlighted == True).count()
-    total_items_count = db.query(Item).count()
-    total_offers_count = db.query(ServiceOffer).count()
+    # Statistiche per la dashboard: contatori mantenuti da trigger, una query (app/stats.py)
+    stats = admin_stats(db)
 
     return templates.TemplateResponse(
         "admin_dashboard.html",
@@ -869,17 +960,37 @@ def admin_dashboard(
             "request": request,
             "requires_token": requires_token,
             "admin_token": token or "",
-            "pending_ads_count": pending_ads_count,
-            "active_ads_count": active_ads_count,
-            "pending_offers_count": pending_offers_count,
-            "published_offers_count": published_offers_count,
-            "businesses_count": businesses_count,
-            "highlighted_businesses_count": highlighted_businesses_count,
-            "total_items_count": total_items_count,
-            "total_offers_count": total_offers_count,
+            **{f"{name}_count": value for name, value in stats.items()},
         }
     )
 
+@app.get("/admin/profiler", response_class=HTMLResponse)
+def admin_profiler(
+    request: Request,
+    token: str | None = Query(None),
+    flagged: bool = Query(False),
+):
+    """Ultime richieste con gli statement SQL eseguiti (SQL_PROFILE=true)"""
+    env_token = os.getenv("ADMIN_TOKEN", "")
+    requires_token = bool(env_token)
+    if requires_token:
+        _check_admin(token, env_token)
+    else:
+        token = ""
+    return templates.TemplateResponse(
+        "admin_profiler.html",
+        {
+            "request": request,
+            "requires_token": requires_token,
+            "admin_token": token or "",
+            "enabled": SQL_PROFILE,
+            "flagged": flagged,
+            "slow_ms": SQL_SLOW_MS,
+            "repeat_threshold": SQL_REPEAT_THRESHOLD,
+            "profiles": recent_profiles(flagged),
+        },
+    )
+
 @app.get("/admin/ad-requests", response_class=HTMLResponse)
 def admin_ad_requests(
     request: Request,
@@ -951,6 +1062,7 @@ def update_ad_request_status(
         raise HTTPException(status_code=400, detail="Stato non valido")
     ad_request.status = new_status
     db.commit()
+    invalidate_stats()
     return {"status": "ok"}
 
 @app.delete("/ad-requests/{request_id}")
@@ -966,6 +1078,7 @@ def delete_ad_request(
         raise HTTPException(status_code=404, detail="Richiesta non trovata")
     db.delete(ad_request)
     db.commit()
+    invalidate_stats()
     return {"status": "ok"}
 
 # Pagine legali e informative
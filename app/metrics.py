@@ -0,0 +1,196 @@
+"""Metriche in formato Prometheus (text exposition 0.0.4), senza dipendenze.
+
+Contatori, gauge e istogrammi con etichette vivono in un registro di
+processo: l'API li espone su `/metrics`, worker e bot (processi separati) su
+una porta propria (`WORKER_METRICS_PORT`, `BOT_METRICS_PORT`) tramite
+`serve()`. Con più worker uvicorn ogni processo ha i suoi valori, come con il
+client ufficiale senza multiprocess mode.
+
+Il costo per osservazione è un lock e una bisezione sui bucket: si lascia
+acceso in produzione. Le etichette devono restare a cardinalità bassa
+(route come template, nome della fonte, comando del bot), mai URL o query.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_registry: list["_Metric"] = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else f"{int(value)}"
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {_format(v)}" for key, v in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        # Conteggi per bucket non cumulativi (+ uno per +Inf): cumulati solo in render
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="%s"' % _format(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_format(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Espone `render()` su http://host:port/ in un thread daemon (worker e bot)."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+# --- Richieste HTTP e query del DB ---------------------------------------------------
+
+HTTP_REQUESTS = Counter("http_requests_total", "Richieste HTTP servite", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Latenza delle richieste HTTP", ("method", "route"))
+HTTP_DB_QUERIES = Histogram("http_request_db_queries", "Query SQL per richiesta HTTP", ("route",), COUNT_BUCKETS)
+HTTP_DB_SECONDS = Histogram("http_request_db_seconds", "Tempo passato nel DB per richiesta HTTP", ("route",), DB_BUCKETS)
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Durata delle singole query SQL", ("operation",), DB_BUCKETS)
+
+# [query, secondi] della richiesta in corso; None fuori da una richiesta (worker, bot)
+request_db_usage: ContextVar[list | None] = ContextVar("request_db_usage", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    elapsed = perf_counter() - start
+    operation = (statement.lstrip()[:12].split() or [""])[0].lower()
+    DB_QUERY_SECONDS.observe(elapsed, operation=operation)
+    usage = request_db_usage.get()
+    if usage is not None:
+        usage[0] += 1
+        usage[1] += elapsed
+
+def instrument_engine(sync_engine) -> None:
+    """Misura ogni query dell'engine (per l'engine async: `get_async_engine().sync_engine`)."""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza, stato e query SQL per route (template, non il path reale)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        usage = [0, 0.0]
+        token = request_db_usage.set(usage)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            request_db_usage.reset(token)
+            route = getattr(scope.get("route"), "path", None) or ("/static" if scope["path"].startswith("/static/") else "other")
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=str(status[0]))
+            HTTP_LATENCY.observe(elapsed, method=scope["method"], route=route)
+            HTTP_DB_QUERIES.observe(usage[0], route=route)
+            HTTP_DB_SECONDS.observe(usage[1], route=route)
@@ -0,0 +1,226 @@
+"""Migrazioni dello schema (SQLite).
+
+`Base.metadata.create_all` crea solo le tabelle mancanti: colonne e indici
+aggiunti dopo la prima installazione arrivano da qui. Ogni migrazione ha un id
+progressivo, viene registrata in `schema_migrations` ed è idempotente, così
+funziona sia sui DB esistenti sia su quelli appena creati da create_all.
+
+    python -m app.migrations
+"""
+from datetime import datetime
+from typing import Callable
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import Connection, Engine
+from .db import engine as default_engine
+
+def _columns(conn: Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _create_indexes(conn: Connection, statements: list[str]) -> None:
+    for stmt in statements:
+        conn.execute(text(stmt))
+
+def _items_image_url(conn: Connection) -> None:
+    # Ex add_image_url_column.py
+    _add_column(conn, "items", "image_url", "VARCHAR(500) DEFAULT ''")
+
+def _ads_feed_columns(conn: Connection) -> None:
+    _add_column(conn, "ads", "show_in_feed", "BOOLEAN DEFAULT 1")
+    _add_column(conn, "ads", "sidebar_slot", "VARCHAR(20) DEFAULT ''")
+    _add_column(conn, "ads", "image_url", "VARCHAR(500) DEFAULT ''")
+
+def _service_offers_rate(conn: Connection) -> None:
+    _add_column(conn, "service_offers", "rate", "VARCHAR(100) DEFAULT ''")
+
+def _items_unique_url(conn: Connection) -> None:
+    # Prima dell'indice univoco potevano esistere duplicati: si tiene il più vecchio
+    conn.execute(text("DELETE FROM items WHERE id NOT IN (SELECT MIN(id) FROM items GROUP BY url)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_items_url ON items (url)"))
+
+def _hot_query_indexes(conn: Connection) -> None:
+    _create_indexes(conn, [
+        # /items, /dashboard: ORDER BY published_at DESC [WHERE category = ?]
+        "CREATE INDEX IF NOT EXISTS ix_items_published_at ON items (published_at)",
+        "CREATE INDEX IF NOT EXISTS ix_items_category_published_at ON items (category, published_at)",
+        # bot /latest e /cat: ORDER BY score DESC, created_at DESC [WHERE category = ?]
+        "CREATE INDEX IF NOT EXISTS ix_items_score_created_at ON items (score, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_items_category_score_created_at ON items (category, score, created_at)",
+        # /dashboard: SELECT DISTINCT city
+        "CREATE INDEX IF NOT EXISTS ix_items_city ON items (city)",
+        # /items?include_ads, /dashboard, bot: ads attivi (e nel feed) per data
+        "CREATE INDEX IF NOT EXISTS ix_ads_active_feed_created_at ON ads (active, show_in_feed, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_ads_active_created_at ON ads (active, created_at)",
+        # /offers, /api/offers, bot /offers, offerte in evidenza in dashboard
+        "CREATE INDEX IF NOT EXISTS ix_service_offers_status_created_at ON service_offers (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_service_offers_status_highlighted_created_at ON service_offers (status, highlighted, created_at)",
+    ])
+
+def _pagination_indexes(conn: Connection) -> None:
+    _create_indexes(conn, [
+        # /api/businesses: keyset su (created_at, id) [WHERE category = ?]
+        "CREATE INDEX IF NOT EXISTS ix_local_businesses_created_at ON local_businesses (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_local_businesses_category_created_at ON local_businesses (category, created_at)",
+    ])
+
+def _fts_table(conn: Connection, table: str, columns: list[str]) -> None:
+    # Indice FTS5 "external content" sulla tabella + trigger di allineamento
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new_cols = ", ".join(f"new.{c}" for c in columns)
+    old_cols = ", ".join(f"old.{c}" for c in columns)
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+    ))
+    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+def _fulltext_search(conn: Connection) -> bool:
+    try:
+        conn.execute(text("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)"))
+        conn.execute(text("DROP TABLE temp._fts5_probe"))
+    except OperationalError:
+        print("[WARN] SQLite senza FTS5: la ricerca userà LIKE")
+        return False
+    _fts_table(conn, "items", ["title", "summary"])
+    _fts_table(conn, "service_offers", ["title", "description"])
+    _fts_table(conn, "local_businesses", ["name", "description"])
+    return True
+
+def _fetch_state_json_offset(conn: Connection) -> None:
+    _add_column(conn, "fetch_state", "json_offset", "INTEGER")
+
+def _jobs_progress_and_dedup(conn: Connection) -> None:
+    _add_column(conn, "jobs", "progress", "TEXT DEFAULT ''")
+    # Prima dell'indice potevano esserci più job attivi dello stesso tipo: resta il più vecchio
+    conn.execute(text(
+        "UPDATE jobs SET status = 'failed', result = 'Duplicato' WHERE status IN ('queued', 'running') "
+        "AND id NOT IN (SELECT MIN(id) FROM jobs WHERE status IN ('queued', 'running') GROUP BY kind)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_active_kind ON jobs (kind) WHERE status IN ('queued', 'running')"
+    ))
+
+def _fetch_state_polling(conn: Connection) -> None:
+    _add_column(conn, "fetch_state", "poll_interval", "INTEGER")
+    _add_column(conn, "fetch_state", "failures", "INTEGER DEFAULT 0")
+    _add_column(conn, "fetch_state", "next_poll_at", "DATETIME")
+
+def _stats_counters(conn: Connection) -> None:
+    # Contatori di /admin mantenuti da trigger: la home non fa più count() su tabelle intere
+    from .stats import COUNTERS, condition
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS stats_counters (name VARCHAR(50) PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)"
+    ))
+    by_table: dict[str, list[tuple[str, tuple[str, str] | None]]] = {}
+    for name, (table, cond) in COUNTERS.items():
+        by_table.setdefault(table, []).append((name, cond))
+
+    def hit(cond, prefix: str) -> str:
+        # 0/1 anche con colonne NULL (un NULL renderebbe NULL il contatore)
+        return f"(CASE WHEN {condition(cond, prefix)} THEN 1 ELSE 0 END)"
+
+    def updates(deltas: dict[str, str]) -> str:
+        return " ".join(f"UPDATE stats_counters SET value = value + {delta} WHERE name = '{name}';" for name, delta in deltas.items())
+
+    for table, counters in by_table.items():
+        inserted = {name: hit(cond, "new.") for name, cond in counters}
+        deleted = {name: "-" + hit(cond, "old.") for name, cond in counters}
+        changed = {name: f"{hit(cond, 'new.')} - {hit(cond, 'old.')}" for name, cond in counters if cond}
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_ai AFTER INSERT ON {table} BEGIN {updates(inserted)} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_stats_ad AFTER DELETE ON {table} BEGIN {updates(deleted)} END"))
+        if changed:
+            columns = ", ".join(sorted({cond[0] for _, cond in counters if cond}))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_stats_au AFTER UPDATE OF {columns} ON {table} BEGIN {updates(changed)} END"
+            ))
+        for name, cond in counters:
+            conn.execute(text(
+                f"INSERT OR REPLACE INTO stats_counters (name, value) SELECT '{name}', count(*) FROM {table} WHERE {condition(cond)}"
+            ))
+
+def _items_normalized_url(conn: Connection) -> None:
+    # Le righe salvate prima della normalizzazione degli URL (utm_*, frammenti...) non
+    # coincidono con quelle nuove: si riscrivono, poi si tengono i più vecchi come in 0004
+    from .urls import normalize_url
+    changed = [
+        {"id": row_id, "url": normalized}
+        for row_id, url in conn.execute(text("SELECT id, url FROM items"))
+        if url and (normalized := normalize_url(url)) != url
+    ]
+    if not changed:
+        return
+    # Senza l'indice univoco: durante gli UPDATE due righe possono avere lo stesso URL
+    conn.execute(text("DROP INDEX IF EXISTS ix_items_url"))
+    conn.execute(text("UPDATE items SET url = :url WHERE id = :id"), changed)
+    _items_unique_url(conn)
+
+def _jobs_heartbeat(conn: Connection) -> None:
+    _add_column(conn, "jobs", "heartbeat_at", "DATETIME")
+
+MIGRATIONS: list[tuple[str, Callable[[Connection], bool | None]]] = [
+    ("0001_items_image_url", _items_image_url),
+    ("0002_ads_feed_columns", _ads_feed_columns),
+    ("0003_service_offers_rate", _service_offers_rate),
+    ("0004_items_unique_url", _items_unique_url),
+    ("0005_hot_query_indexes", _hot_query_indexes),
+    ("0006_pagination_indexes", _pagination_indexes),
+    ("0007_fulltext_search", _fulltext_search),
+    ("0008_fetch_state_json_offset", _fetch_state_json_offset),
+    ("0009_jobs_progress_and_dedup", _jobs_progress_and_dedup),
+    ("0010_fetch_state_polling", _fetch_state_polling),
+    ("0011_stats_counters", _stats_counters),
+    ("0012_items_normalized_url", _items_normalized_url),
+    ("0013_jobs_heartbeat", _jobs_heartbeat),
+]
+
+def run_migrations(engine: Engine = default_engine) -> list[str]:
+    """Applica le migrazioni mancanti, ognuna nella propria transazione.
+
+    Una migrazione che restituisce False non viene registrata e sarà ritentata.
+    """
+    if engine.dialect.name != "sqlite":
+        return []
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (id VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT id FROM schema_migrations"))}
+    done = []
+    for migration_id, migrate in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        with engine.begin() as conn:
+            if migrate(conn) is False:
+                continue
+            conn.execute(
+                text("INSERT INTO schema_migrations (id, applied_at) VALUES (:id, :at)"),
+                {"id": migration_id, "at": datetime.utcnow()},
+            )
+        done.append(migration_id)
+    return done
+
+if __name__ == "__main__":
+    from .db import Base
+    from . import models  # noqa: F401  (registra le tabelle su Base.metadata)
+
+    Base.metadata.create_all(bind=default_engine)
+    applied = run_migrations()
+    print("✅ Migrazioni applicate: " + ", ".join(applied) if applied else "✅ Schema già aggiornato")
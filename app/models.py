@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, DateTime, Float, Boolean, Text, Date
+from sqlalchemy import String, Integer, DateTime, Float, Boolean, Text, Date, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime, date
 from .db import Base
@@ -8,7 +8,7 @@ class Item(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     source: Mapped[str] = mapped_column(String(200))
     title: Mapped[str] = mapped_column(String(500))
-    url: Mapped[str] = mapped_column(String(500))
+    url: Mapped[str] = mapped_column(String(500), unique=True, index=True)  # URL normalizzato
     summary: Mapped[str] = mapped_column(String(2000), default="")
     category: Mapped[str] = mapped_column(String(50), default="altro")
     city: Mapped[str] = mapped_column(String(100), default="Fiumicino")
@@ -17,6 +17,15 @@ class Item(Base):
     image_url: Mapped[str] = mapped_column(String(500), default="")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # Indici allineati a filtri + ordinamenti di /items, /dashboard e bot (vedi app/migrations.py)
+    __table_args__ = (
+        Index("ix_items_published_at", "published_at"),
+        Index("ix_items_category_published_at", "category", "published_at"),
+        Index("ix_items_score_created_at", "score", "created_at"),
+        Index("ix_items_category_score_created_at", "category", "score", "created_at"),
+        Index("ix_items_city", "city"),
+    )
+
 class Ad(Base):
     __tablename__ = "ads"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -32,6 +41,11 @@ class Ad(Base):
     image_url: Mapped[str] = mapped_column(String(500), default="")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        Index("ix_ads_active_feed_created_at", "active", "show_in_feed", "created_at"),
+        Index("ix_ads_active_created_at", "active", "created_at"),
+    )
+
 class ServiceOffer(Base):
     __tablename__ = "service_offers"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -49,6 +63,11 @@ class ServiceOffer(Base):
     highlighted: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        Index("ix_service_offers_status_created_at", "status", "created_at"),
+        Index("ix_service_offers_status_highlighted_created_at", "status", "highlighted", "created_at"),
+    )
+
 class LocalBusiness(Base):
     __tablename__ = "local_businesses"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -66,6 +85,11 @@ class LocalBusiness(Base):
     highlighted: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        Index("ix_local_businesses_created_at", "created_at"),
+        Index("ix_local_businesses_category_created_at", "category", "created_at"),
+    )
+
 class AdRequest(Base):
     __tablename__ = "ad_requests"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -77,3 +101,61 @@ class AdRequest(Base):
     message: Mapped[str] = mapped_column(Text, default="")
     status: Mapped[str] = mapped_column(String(20), default="pending")  # pending, contacted, approved, rejected
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+class FetchState(Base):
+    __tablename__ = "fetch_state"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    source_url: Mapped[str] = mapped_column(String(500), unique=True)
+    etag: Mapped[str] = mapped_column(String(200), default="")
+    last_modified: Mapped[str] = mapped_column(String(100), default="")
+    content_hash: Mapped[str] = mapped_column(String(64), default="")  # sha256 del corpo
+    json_offset: Mapped[int | None] = mapped_column(Integer, nullable=True)  # dove stava il JSON incorporato
+    poll_interval: Mapped[int | None] = mapped_column(Integer, nullable=True)  # secondi, appreso (app/polling.py)
+    failures: Mapped[int] = mapped_column(Integer, default=0)  # errori consecutivi
+    next_poll_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    checked_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    changed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+class WorkerLease(Base):
+    """Lock di leadership con scadenza: un solo worker alla volta esegue scheduler e job."""
+    __tablename__ = "worker_leases"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(200))
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(50))  # ingest
+    trigger: Mapped[str] = mapped_column(String(20), default="manual")  # manual, schedule
+    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued, running, done, failed
+    worker: Mapped[str] = mapped_column(String(200), default="")
+    progress: Mapped[str] = mapped_column(Text, default="")  # JSON aggiornato durante l'esecuzione
+    result: Mapped[str] = mapped_column(Text, default="")  # JSON con le statistiche, o messaggio d'errore
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Rinnovato dal worker insieme al lease finché il job è in esecuzione
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+        # Al più un job attivo per tipo: i trigger concorrenti riusano quello esistente
+        Index(
+            "ux_jobs_active_kind", "kind", unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+class ContentVersion(Base):
+    """Contatore incrementato a ogni modifica dei contenuti: invalida le cache di tutti i processi."""
+    __tablename__ = "content_version"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+class StatCounter(Base):
+    """Contatori della home admin, aggiornati da trigger (app/stats.py, migrazione 0011)."""
+    __tablename__ = "stats_counters"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
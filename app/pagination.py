@@ -0,0 +1,73 @@
+"""Paginazione keyset (cursore) per gli endpoint JSON.
+
+Le pagine sono ordinate per (timestamp DESC, id DESC) e il cursore codifica
+l'ultima coppia restituita: la pagina successiva parte con un confronto
+`(ts, id) < (cursore)` che usa l'indice, quindi costa come la prima. Il
+corpo resta una lista (compatibile con i client esistenti); il token della
+pagina successiva viaggia negli header `X-Next-Cursor` e `Link`.
+"""
+import base64, json, os
+from datetime import datetime
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query as ORMQuery
+
+MAX_PAGE_SIZE = max(int(os.getenv("API_MAX_PAGE_SIZE", "200") or 200), 1)
+
+def encode_cursor(ts: datetime, row_id: int, position: int | None = None) -> str:
+    # `position` (facoltativa): indice assoluto del prossimo item, usato dal feed per gli sponsor
+    fields = [ts.isoformat(), row_id] if position is None else [ts.isoformat(), row_id, position]
+    raw = json.dumps(fields, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _cursor_fields(token: str) -> tuple[datetime, int, int | None]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        ts, row_id, *rest = json.loads(raw)
+        position = int(rest.pop()) if len(rest) == 1 else None
+        if rest or (position is not None and position < 0):
+            raise ValueError(token)
+        return datetime.fromisoformat(ts), int(row_id), position
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    ts, row_id, _ = _cursor_fields(token)
+    return ts, row_id
+
+def cursor_position(token: str) -> int | None:
+    """Posizione assoluta portata dal cursore (solo quelli del feed), altrimenti None."""
+    return _cursor_fields(token)[2]
+
+def _keyset(q, ts_col, id_col, cursor: str | None, limit: int):
+    # Vale sia per Query (sync) sia per select() (async): entrambi hanno order_by/filter/limit
+    q = q.order_by(ts_col.desc(), id_col.desc())
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        q = q.filter(tuple_(ts_col, id_col) < tuple_(ts, row_id))
+    return q.limit(limit + 1)
+
+def _page(rows: list, ts_col, id_col, limit: int) -> tuple[list, str | None]:
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, ts_col.key), getattr(last, id_col.key))
+
+def paginate(q: ORMQuery, ts_col, id_col, cursor: str | None, limit: int) -> tuple[list, str | None]:
+    """Applica ordinamento e filtro keyset; restituisce (righe, cursore successivo)."""
+    rows = _keyset(q, ts_col, id_col, cursor, limit).all()
+    return _page(rows, ts_col, id_col, limit)
+
+async def paginate_async(db: AsyncSession, stmt: Select, ts_col, id_col, cursor: str | None, limit: int) -> tuple[list, str | None]:
+    """Come `paginate`, per una select() eseguita su AsyncSession."""
+    rows = list((await db.scalars(_keyset(stmt, ts_col, id_col, cursor, limit))).all())
+    return _page(rows, ts_col, id_col, limit)
+
+def set_next_cursor(request: Request, response: Response, next_cursor: str | None) -> None:
+    if not next_cursor:
+        return
+    response.headers["X-Next-Cursor"] = next_cursor
+    next_url = request.url.include_query_params(cursor=next_cursor)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
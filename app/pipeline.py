@@ -0,0 +1,124 @@
+"""Pipeline a stadi su code asyncio limitate.
+
+Ogni stadio ha uno o più worker che leggono dalla coda in ingresso, chiamano
+l'handler e mettono i risultati nella coda dello stadio successivo. Le code
+sono limitate (`queue_size`): se uno stadio è lento, quelli a monte si
+fermano invece di accumulare tutto in memoria, e intanto gli stadi veloci
+(es. download) continuano a lavorare in parallelo a quelli lenti (parsing).
+
+Un handler riceve un elemento (o una lista, se lo stadio ha `batch_size` > 1)
+e restituisce una lista di elementi per lo stadio successivo, anche vuota.
+Le eccezioni di un handler interrompono la pipeline, a meno che lo stadio
+abbia `on_error`: in quel caso l'elemento viene scartato e contato.
+"""
+import asyncio, time
+from typing import Any, Awaitable, Callable, Iterable
+
+_END = object()
+
+class StageStats:
+    __slots__ = ("received", "emitted", "errors", "busy", "started", "finished")
+
+    def __init__(self):
+        self.received = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy = 0.0  # secondi passati negli handler (sommati sui worker)
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def as_dict(self) -> dict:
+        wall = (self.finished - self.started) if self.started is not None and self.finished is not None else 0.0
+        return {
+            "in": self.received,
+            "out": self.emitted,
+            "errors": self.errors,
+            "busy_s": round(self.busy, 3),
+            "wall_s": round(wall, 3),
+        }
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Iterable[Any] | None]],
+        workers: int = 1,
+        batch_size: int = 1,
+        on_error: Callable[[Any, Exception], None] | None = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 1)
+        self.on_error = on_error
+        self.stats = StageStats()
+
+    async def _call(self, item: Any, out: asyncio.Queue | None) -> None:
+        start = time.perf_counter()
+        try:
+            results = await self.handler(item)
+        except Exception as e:
+            if self.on_error is None:
+                raise
+            self.stats.errors += 1
+            self.on_error(item, e)
+            return
+        finally:
+            self.stats.busy += time.perf_counter() - start
+        for result in results or ():
+            self.stats.emitted += 1
+            if out is not None:
+                await out.put(result)
+
+    async def _worker(self, inbox: asyncio.Queue, out: asyncio.Queue | None) -> None:
+        batch: list = []
+        while True:
+            item = await inbox.get()
+            if item is _END:
+                break
+            if self.stats.started is None:
+                self.stats.started = time.perf_counter()
+            self.stats.received += 1
+            if self.batch_size == 1:
+                await self._call(item, out)
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._call(batch, out)
+                batch = []
+        if batch:
+            await self._call(batch, out)
+
+async def run_pipeline(items: Iterable[Any], stages: list[Stage], queue_size: int = 64) -> dict[str, dict]:
+    """Esegue gli stadi in sequenza sugli elementi; restituisce le statistiche per stadio."""
+    queues = [asyncio.Queue(maxsize=max(queue_size, 1)) for _ in stages]
+
+    async def produce() -> None:
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(stages[0].workers):
+            await queues[0].put(_END)
+
+    async def run_stage(index: int) -> None:
+        stage = stages[index]
+        out = queues[index + 1] if index + 1 < len(stages) else None
+        await asyncio.gather(*(stage._worker(queues[index], out) for _ in range(stage.workers)))
+        stage.stats.finished = time.perf_counter()
+        # Tutti i worker hanno finito: si chiude lo stadio successivo
+        if out is not None:
+            for _ in range(stages[index + 1].workers):
+                await out.put(_END)
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(run_stage(i)) for i in range(len(stages))]
+    try:
+        # Al primo errore non gestito si cancella tutto, altrimenti gli stadi a monte
+        # resterebbero bloccati su una coda piena
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {stage.name: stage.stats.as_dict() for stage in stages}
@@ -0,0 +1,66 @@
+"""Frequenza di polling adattiva per fonte.
+
+Ogni fonte ha un intervallo (`fetch_state.poll_interval`) che si adatta a
+ogni controllo:
+
+- nuovi item: l'intervallo si dimezza (la fonte pubblica più spesso di
+  quanto la guardiamo);
+- nessuna novità: cresce del 50%;
+- se il feed riporta le date di pubblicazione, l'intervallo viene anche
+  avvicinato a metà del distacco mediano tra un item e il successivo.
+
+Gli errori non toccano l'intervallo appreso ma allungano solo la prossima
+attesa (backoff esponenziale, 2^fallimenti). Il prossimo controllo ha un
+jitter di ±POLL_JITTER, così le fonti non scattano tutte insieme.
+
+In `rss_list.json`/`html_rules.json` ogni fonte può fissare l'intervallo
+(`poll_interval`, secondi) o restringerne i limiti (`min_poll_interval`,
+`max_poll_interval`).
+"""
+import os, random
+from datetime import datetime, timedelta
+from statistics import median
+
+POLL_DEFAULT_INTERVAL = int(os.getenv("POLL_DEFAULT_INTERVAL", "3600") or 3600)
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", "300") or 300)
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", "86400") or 86400)
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1") or 0)
+
+def poll_limits(rule: dict) -> tuple[int, int, int | None]:
+    """(minimo, massimo, intervallo fisso o None) per la fonte, dagli override di configurazione."""
+    fixed = rule.get("poll_interval")
+    low = int(rule.get("min_poll_interval") or POLL_MIN_INTERVAL)
+    high = max(int(rule.get("max_poll_interval") or POLL_MAX_INTERVAL), low)
+    return low, high, int(fixed) if fixed else None
+
+def publish_gap(published: list) -> float | None:
+    """Distacco mediano (secondi) tra date di pubblicazione consecutive; None se non ce ne sono abbastanza."""
+    stamps = sorted(p.timestamp() for p in published if p is not None)
+    gaps = [b - a for a, b in zip(stamps, stamps[1:]) if b > a]
+    return median(gaps) if len(gaps) >= 2 else None
+
+def initial_interval(rule: dict) -> int:
+    """Intervallo di una fonte mai controllata con successo."""
+    low, high, fixed = poll_limits(rule)
+    return fixed or min(max(POLL_DEFAULT_INTERVAL, low), high)
+
+def next_interval(rule: dict, interval: int | None, new_items: int, gap: float | None) -> int:
+    low, high, fixed = poll_limits(rule)
+    if fixed:
+        return fixed
+    current = float(interval or initial_interval(rule))
+    current = current / 2 if new_items else current * 1.5
+    if gap:
+        current = (current + gap / 2) / 2
+    return int(min(max(current, low), high))
+
+def next_poll_at(rule: dict, interval: int, failures: int, now: datetime | None = None) -> datetime:
+    _, high, _ = poll_limits(rule)
+    wait = min(interval * (2 ** failures), max(high, interval))
+    wait *= 1 + random.uniform(-POLL_JITTER, POLL_JITTER)
+    return (now or datetime.utcnow()) + timedelta(seconds=wait)
+
+def is_due(state: dict | None, now: datetime | None = None) -> bool:
+    if not state or state.get("next_poll_at") is None:
+        return True
+    return state["next_poll_at"] <= (now or datetime.utcnow())
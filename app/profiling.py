@@ -0,0 +1,163 @@
+"""Profilo SQL per richiesta HTTP (opt-in con SQL_PROFILE=true).
+
+Con il profilo attivo ogni statement eseguito durante una richiesta viene
+registrato con la sua durata. A fine richiesta si segnalano le query sopra
+SQL_SLOW_MS e gli statement ripetuti (stesso SQL almeno SQL_REPEAT_THRESHOLD
+volte: il classico N+1, o una count() di troppo); il riepilogo va nell'header
+`Server-Timing` (visibile nei devtools del browser) e le ultime
+SQL_PROFILE_HISTORY richieste si consultano su /admin/profiler.
+
+Spento non registra listener né middleware. Le metriche aggregate (query e
+tempo nel DB per route) sono sempre attive in app/metrics.py.
+"""
+import os, threading, time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "false").lower() in {"1", "true", "yes"}
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100") or 100)
+SQL_REPEAT_THRESHOLD = max(int(os.getenv("SQL_REPEAT_THRESHOLD", "3") or 3), 2)
+SQL_PROFILE_HISTORY = max(int(os.getenv("SQL_PROFILE_HISTORY", "200") or 200), 1)
+# Statement conservati per richiesta (oltre si contano soltanto)
+MAX_STATEMENTS = 500
+# Percorsi non profilati: file statici e la pagina del profilo stessa
+SKIP_PREFIXES = ("/static/", "/admin/profiler")
+
+class RequestProfile:
+    __slots__ = ("method", "path", "route", "status", "started_at", "duration_ms", "statements", "dropped")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = ""
+        self.status = 0
+        self.started_at = datetime.utcnow()
+        self.duration_ms = 0.0
+        self.statements: list[tuple[str, float]] = []
+        self.dropped = 0
+
+    def add(self, statement: str, ms: float) -> None:
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append((statement, ms))
+        else:
+            self.dropped += 1
+
+    @property
+    def db_ms(self) -> float:
+        return sum(ms for _, ms in self.statements)
+
+    @property
+    def query_count(self) -> int:
+        return len(self.statements) + self.dropped
+
+    def slow(self) -> list[tuple[str, float]]:
+        return [(sql, ms) for sql, ms in self.statements if ms >= SQL_SLOW_MS]
+
+    def repeated(self) -> list[dict]:
+        """Statement con lo stesso SQL (parametri a parte) eseguiti più volte nella richiesta."""
+        counts = Counter(sql for sql, _ in self.statements)
+        return [
+            {"sql": sql, "count": count, "ms": round(sum(ms for s, ms in self.statements if s == sql), 2)}
+            for sql, count in counts.most_common() if count >= SQL_REPEAT_THRESHOLD
+        ]
+
+    def server_timing(self, elapsed_ms: float) -> str:
+        flags = []
+        slow, repeated = len(self.slow()), len(self.repeated())
+        if slow:
+            flags.append(f"{slow} lente")
+        if repeated:
+            flags.append(f"{repeated} ripetute")
+        desc = f"{self.query_count} query" + (", " + ", ".join(flags) if flags else "")
+        return f'db;dur={self.db_ms:.1f};desc="{desc}", app;dur={elapsed_ms:.1f}'
+
+    def as_dict(self) -> dict:
+        repeated = {entry["sql"] for entry in self.repeated()}
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 2),
+            "db_ms": round(self.db_ms, 2),
+            "query_count": self.query_count,
+            "slow_count": len(self.slow()),
+            "repeated": self.repeated(),
+            "statements": [
+                {"sql": sql, "ms": round(ms, 2), "slow": ms >= SQL_SLOW_MS, "repeated": sql in repeated}
+                for sql, ms in self.statements
+            ],
+            "dropped": self.dropped,
+        }
+
+_current: ContextVar[RequestProfile | None] = ContextVar("sql_profile", default=None)
+_history: deque[RequestProfile] = deque(maxlen=SQL_PROFILE_HISTORY)
+_history_lock = threading.Lock()
+
+def recent_profiles(flagged_only: bool = False) -> list[dict]:
+    """Ultime richieste profilate, la più recente per prima."""
+    with _history_lock:
+        profiles = list(_history)
+    out = [p.as_dict() for p in reversed(profiles)]
+    if flagged_only:
+        out = [p for p in out if p["slow_count"] or p["repeated"]]
+    return out
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._profile_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_profile_start", None)
+    profile = _current.get()
+    if start is not None and profile is not None:
+        profile.add(statement, (time.perf_counter() - start) * 1000)
+
+def profile_engine(sync_engine) -> None:
+    """Registra ogni statement dell'engine nel profilo della richiesta corrente (se SQL_PROFILE)."""
+    if not SQL_PROFILE:
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+def _report(profile: RequestProfile) -> None:
+    where = f"{profile.method} {profile.path}"
+    for sql, ms in profile.slow():
+        print(f"[WARN] SQL lenta ({ms:.1f}ms) in {where}: {' '.join(sql.split())[:300]}")
+    for entry in profile.repeated():
+        print(f"[WARN] SQL ripetuta {entry['count']}x ({entry['ms']}ms) in {where}: {' '.join(entry['sql'].split())[:300]}")
+
+class ProfilingMiddleware:
+    """Middleware ASGI: profilo SQL della richiesta, header Server-Timing e storico per /admin/profiler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(scope["method"], scope["path"] + (f"?{scope['query_string'].decode()}" if scope.get("query_string") else ""))
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                # Le query fatte durante lo streaming del corpo restano fuori dall'header, non dallo storico
+                timing = profile.server_timing((time.perf_counter() - start) * 1000)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            profile.route = getattr(scope.get("route"), "path", "") or ""
+            with _history_lock:
+                _history.append(profile)
+            _report(profile)
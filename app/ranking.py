@@ -1,5 +1,5 @@
 import os, re
-from typing import Dict
+from typing import Dict, Iterable, Mapping
 
 # Euristica leggera per MVP. Punteggi cumulativi.
 KEYWORDS = {
@@ -10,18 +10,74 @@ KEYWORDS = {
     "annunci": ["vendo", "cerco", "regalo", "annuncio", "offro"],
 }
 
+class _Classifier:
+    """Classificatore compilato una volta: una sola regex per tutte le keyword.
+
+    La regex è un lookahead ancorato a un confine di parola, così un'unica
+    scansione del testo trova anche match sovrapposti; le keyword più lunghe
+    vengono provate per prime. In ogni posizione vince quindi una sola
+    keyword: quelle che ne sono un prefisso fino a un confine di parola
+    ("festa" in "festa della musica") si contano a parte, con `implied`, come
+    faceva la versione con una re.search per keyword.
+    """
+
+    def __init__(self, keywords: Mapping[str, Iterable[str]], city: str):
+        self.categories = list(keywords.keys())
+        self.kw_categories: Dict[str, list[int]] = {}
+        for idx, cat in enumerate(self.categories):
+            for kw in keywords[cat]:
+                cats = self.kw_categories.setdefault(kw.lower(), [])
+                if idx not in cats:
+                    cats.append(idx)
+        # Keyword trovata -> keyword presenti nello stesso punto (lei e i suoi prefissi a fine parola)
+        self.implied: Dict[str, list[str]] = {
+            kw: [other for other in self.kw_categories if other == kw or re.match(re.escape(other) + r"\b", kw)]
+            for kw in self.kw_categories
+        }
+        alternation = "|".join(re.escape(kw) for kw in sorted(self.kw_categories, key=len, reverse=True))
+        self.pattern = re.compile(r"\b(?=(" + alternation + r")\b)") if alternation else None
+        self.city = city.lower()
+
+    def __call__(self, title: str, summary: str) -> Dict[str, float]:
+        text = f"{title} {summary}".lower()
+        scores = [0.0] * len(self.categories)
+        if self.pattern is not None:
+            # Ogni keyword conta una volta sola, come nella versione con re.search
+            found = {implied for kw in set(self.pattern.findall(text)) for implied in self.implied[kw]}
+            for kw in found:
+                for idx in self.kw_categories[kw]:
+                    scores[idx] += 1.0
+        best_cat, best_score = "altro", 0.0
+        for idx, score in enumerate(scores):
+            if score > best_score:
+                best_score, best_cat = score, self.categories[idx]
+        # Bonus se contiene la città (semplice)
+        if self.city in text:
+            best_score += 0.5
+        return {"category": best_cat, "score": float(best_score)}
+
+def _signature(keywords: Mapping[str, Iterable[str]], city: str) -> tuple:
+    return tuple((cat, tuple(kws)) for cat, kws in keywords.items()), city
+
+_classifier = _Classifier(KEYWORDS, os.getenv("CITY", "Fiumicino"))
+_classifier_signature = _signature(KEYWORDS, os.getenv("CITY", "Fiumicino"))
+
+def reload_classifier(keywords: Mapping[str, Iterable[str]] | None = None, city: str | None = None) -> bool:
+    """Ricompila il classificatore se KEYWORDS (o quelle passate) o CITY sono cambiate.
+
+    Restituisce True se l'ha ricompilato. La sostituzione è atomica: le
+    chiamate in corso finiscono con la versione precedente.
+    """
+    global _classifier, _classifier_signature
+    if keywords is not None and keywords is not KEYWORDS:
+        KEYWORDS.clear()
+        KEYWORDS.update({cat: list(kws) for cat, kws in keywords.items()})
+    city = city if city is not None else os.getenv("CITY", "Fiumicino")
+    signature = _signature(KEYWORDS, city)
+    if signature == _classifier_signature:
+        return False
+    _classifier, _classifier_signature = _Classifier(KEYWORDS, city), signature
+    return True
+
 def classify_and_score(title: str, summary: str) -> Dict[str, float]:
-    text = f"{title} {summary}".lower()
-    best_cat, best_score = "altro", 0.0
-    for cat, kws in KEYWORDS.items():
-        score = 0.0
-        for kw in kws:
-            if re.search(r"\b" + re.escape(kw) + r"\b", text):
-                score += 1.0
-        if score > best_score:
-            best_score, best_cat = score, cat
-    # Bonus se contiene la città (semplice)
-    city = os.getenv("CITY", "Fiumicino").lower()
-    if city in text:
-        best_score += 0.5
-    return {"category": best_cat, "score": float(best_score)}
+    return _classifier(title, summary)
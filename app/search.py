@@ -0,0 +1,256 @@
+"""Ricerca full-text su item, offerte e attività (SQLite FTS5).
+
+Gli indici `items_fts`, `service_offers_fts` e `local_businesses_fts` sono
+tabelle FTS5 "external content" create dalla migrazione 0007 e tenute
+allineate da trigger, quindi restano in sync anche con la scrittura bulk
+dell'ingest. Il tokenizer `unicode61 remove_diacritics 2` rende la ricerca
+indifferente agli accenti ("citta" trova "città") e le parole vuote italiane
+vengono ignorate. L'ultimo termine è cercato per prefisso solo se serve: se
+finisce con `*`, se è corto (fino a SEARCH_PREFIX_CHARS caratteri, coperti
+dagli indici di prefisso della tabella FTS) o se il client dice che si sta
+ancora digitando (`prefix=true`); espandere una parola completa legge le
+doclist di tutti i termini che iniziano così. I risultati sono ordinati per
+BM25 (il titolo pesa più del testo).
+
+Calcolare BM25 su tutte le corrispondenze di un termine comune costa troppo
+su milioni di item: per gli item il ranking si fa solo sulle
+SEARCH_CANDIDATES corrispondenze più recenti (che rispettano i filtri di città
+e categoria), delimitate con un vincolo sul rowid che FTS5 applica
+direttamente alla doclist. Il ranking legge solo rowid e bm25; evidenziazione
+e snippet si calcolano poi in Python sulle sole righe restituite (rifare la
+query FTS per riga con highlight() costa una nuova espansione dei prefissi).
+Resta il costo fisso di bm25(), che per l'IDF conta tutte le righe con ciascun
+termine: proporzionale alla frequenza dei termini, non alla finestra.
+"""
+import os, re, unicodedata
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from html import escape
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from .models import Item
+
+# Marcatori usati da highlight()/snippet(): sostituiti con <mark> dopo l'escape HTML
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "a", "ad", "al", "alla", "alle", "agli", "ai", "che", "con", "da", "dal", "dalla", "dei", "del",
+    "della", "delle", "di", "e", "ed", "gli", "i", "il", "in", "la", "le", "lo", "l", "nel", "nella",
+    "o", "per", "su", "sul", "sulla", "tra", "fra", "un", "una", "uno",
+}
+SCOPES = ("items", "offers", "businesses")
+SEARCH_CANDIDATES = max(int(os.getenv("SEARCH_CANDIDATES", "1000") or 1000), 1)
+# Ultimo termine cercato per prefisso anche senza `*` fino a questa lunghezza (prefix='2 3' in 0007)
+SEARCH_PREFIX_CHARS = int(os.getenv("SEARCH_PREFIX_CHARS", "3") or 0)
+
+# Parole dello snippet degli item (come snippet(..., 24) per offerte e attività)
+SNIPPET_TOKENS = 24
+
+def _query_terms(q: str, prefix: bool | None = None) -> tuple[list[str], bool]:
+    """Termini della query (senza parole vuote) e se l'ultimo va cercato per prefisso.
+
+    `prefix` True/False forza la scelta; None la ricava dalla query (`*` finale o termine corto).
+    """
+    tokens = [t.lower() for t in _TOKEN.findall(q or "")]
+    terms = list(dict.fromkeys([t for t in tokens if t not in STOPWORDS] or tokens))
+    if prefix is None:
+        prefix = bool(terms) and ((q or "").rstrip().endswith("*") or 2 <= len(terms[-1]) <= SEARCH_PREFIX_CHARS)
+    return terms, prefix
+
+def build_match_query(q: str, prefix: bool | None = None) -> str:
+    """Trasforma il testo libero in una query FTS5 sicura: termini in AND, l'ultimo per prefisso se serve."""
+    terms, prefix = _query_terms(q, prefix)
+    return " ".join(f'"{t}"' + ("*" if prefix and i == len(terms) - 1 else "") for i, t in enumerate(terms))
+
+@lru_cache(maxsize=8192)
+def _fold(word: str) -> str:
+    # Come il tokenizer `unicode61 remove_diacritics 2`: minuscole, senza accenti
+    if word.isascii():
+        return word.lower()
+    return "".join(ch for ch in unicodedata.normalize("NFKD", word.lower()) if not unicodedata.combining(ch))
+
+class _Marker:
+    """highlight()/snippet() di FTS5 rifatti in Python per le poche righe già scelte dal ranking."""
+
+    def __init__(self, terms: list[str], prefix: bool):
+        folded = [_fold(t) for t in terms]
+        self.prefix = folded.pop() if prefix and folded else None
+        self.exact = set(folded)
+
+    def _hits(self, value: str) -> list[tuple[int, int, str | None]]:
+        # (inizio, fine, termine trovato o None) per ogni parola
+        out = []
+        for m in _TOKEN.finditer(value):
+            word = _fold(m.group())
+            if word in self.exact:
+                out.append((m.start(), m.end(), word))
+            elif self.prefix is not None and word.startswith(self.prefix):
+                out.append((m.start(), m.end(), self.prefix))
+            else:
+                out.append((m.start(), m.end(), None))
+        return out
+
+    @staticmethod
+    def _marked(value: str, tokens: list[tuple[int, int, str | None]], start: int, end: int) -> str:
+        parts, pos = [], start
+        for token_start, token_end, hit in tokens:
+            if hit:
+                parts += [value[pos:token_start], _MARK_OPEN, value[token_start:token_end], _MARK_CLOSE]
+                pos = token_end
+        parts.append(value[pos:end])
+        return "".join(parts)
+
+    def highlight(self, value: str | None) -> str:
+        value = value or ""
+        return self._marked(value, self._hits(value), 0, len(value))
+
+    def snippet(self, value: str | None, size: int = SNIPPET_TOKENS) -> str:
+        value = value or ""
+        tokens = self._hits(value)
+        if len(tokens) <= size:
+            return self.highlight(value)
+        # Come snippet() di FTS5: conta soprattutto quanti termini diversi ha la finestra
+        hits = [hit for *_, hit in tokens]
+        window = Counter(hit for hit in hits[:size] if hit)
+        best, first = 1000 * len(window) + sum(window.values()), 0
+        for start in range(1, len(tokens) - size + 1):
+            leaving, entering = hits[start - 1], hits[start + size - 1]
+            if leaving:
+                window[leaving] -= 1
+                if not window[leaving]:
+                    del window[leaving]
+            if entering:
+                window[entering] += 1
+            score = 1000 * len(window) + sum(window.values())
+            if score > best:
+                best, first = score, start
+        shown = tokens[first:first + size]
+        marked = self._marked(value, shown, shown[0][0], shown[-1][1])
+        return ("…" if first else "") + marked + ("…" if first + size < len(tokens) else "")
+
+def _marked_html(value: str | None) -> str:
+    return escape(value or "").replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+def fts_available(db: Session) -> bool:
+    if db.get_bind().dialect.name != "sqlite":
+        return False
+    return db.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'items_fts'")).first() is not None
+
+def _run(db: Session, sql: str, params: dict) -> list[dict]:
+    return _with_html([dict(row) for row in db.execute(text(sql), params).mappings()])
+
+def _with_html(rows: list[dict]) -> list[dict]:
+    out = []
+    for data in rows:
+        if isinstance(data.get("published_at"), str):
+            data["published_at"] = datetime.fromisoformat(data["published_at"])
+        data["title_html"] = _marked_html(data.pop("title_marked"))
+        data["snippet_html"] = _marked_html(data.pop("snippet_marked"))
+        out.append(data)
+    return out
+
+def search_items(db: Session, q: str, limit: int = 20, city: str | None = None, category: str | None = None,
+                 prefix: bool | None = None) -> list[dict]:
+    terms, prefix = _query_terms(q, prefix)
+    if not terms:
+        return []
+    filters, params = "", {"match": build_match_query(q, prefix), "limit": limit}
+    if city:
+        filters += " AND items.city LIKE :city"
+        params["city"] = f"%{city}%"
+    if category:
+        filters += " AND items.category = :category"
+        params["category"] = category
+    # Senza filtri la tabella items non serve per scegliere le righe (solo rowid e doclist)
+    source = "items_fts JOIN items ON items.id = items_fts.rowid" if filters else "items_fts"
+    # Rowid della N-esima corrispondenza più recente (con gli stessi filtri, altrimenti
+    # la finestra può contenere solo item di altre città): limite inferiore del ranking
+    lowest = db.execute(text(f"""
+        SELECT items_fts.rowid FROM {source}
+        WHERE items_fts MATCH :match{filters}
+        ORDER BY items_fts.rowid DESC LIMIT 1 OFFSET :n
+    """), {**params, "n": SEARCH_CANDIDATES - 1}).scalar()
+    params["lowest"] = lowest or 0
+    rows = db.execute(text(f"""
+        SELECT items.id, items.title, items.summary, items.url, items.source, items.city, items.category,
+               items.published_at, items.image_url, ranked.rank
+        FROM (
+            SELECT items_fts.rowid AS id, bm25(items_fts, 10.0, 1.0) AS rank
+            FROM {source}
+            WHERE items_fts MATCH :match AND items_fts.rowid >= :lowest{filters}
+            ORDER BY rank LIMIT :limit
+        ) AS ranked
+        JOIN items ON items.id = ranked.id
+        ORDER BY ranked.rank
+    """), params).mappings().all()
+    marker = _Marker(terms, prefix)
+    out = []
+    for row in rows:
+        data = dict(row)
+        summary = data.pop("summary")
+        data["title_marked"] = marker.highlight(data["title"])
+        data["snippet_marked"] = marker.snippet(summary)
+        out.append(data)
+    return _with_html(out)
+
+def search_offers(db: Session, q: str, limit: int = 20, prefix: bool | None = None) -> list[dict]:
+    match = build_match_query(q, prefix)
+    if not match:
+        return []
+    return _run(db, """
+        SELECT service_offers.id, service_offers.title, service_offers.category, service_offers.city,
+               service_offers.zone, service_offers.contact_name, service_offers.contact_method,
+               highlight(service_offers_fts, 0, :o, :c) AS title_marked,
+               snippet(service_offers_fts, 1, :o, :c, '…', 24) AS snippet_marked,
+               bm25(service_offers_fts, 10.0, 1.0) AS rank
+        FROM service_offers_fts JOIN service_offers ON service_offers.id = service_offers_fts.rowid
+        WHERE service_offers_fts MATCH :match AND service_offers.status = 'published'
+        ORDER BY rank LIMIT :limit
+    """, {"match": match, "limit": limit, "o": _MARK_OPEN, "c": _MARK_CLOSE})
+
+def search_businesses(db: Session, q: str, limit: int = 20, prefix: bool | None = None) -> list[dict]:
+    match = build_match_query(q, prefix)
+    if not match:
+        return []
+    return _run(db, """
+        SELECT local_businesses.id, local_businesses.name AS title, local_businesses.category,
+               local_businesses.city, local_businesses.address, local_businesses.website,
+               highlight(local_businesses_fts, 0, :o, :c) AS title_marked,
+               snippet(local_businesses_fts, 1, :o, :c, '…', 24) AS snippet_marked,
+               bm25(local_businesses_fts, 10.0, 1.0) AS rank
+        FROM local_businesses_fts JOIN local_businesses ON local_businesses.id = local_businesses_fts.rowid
+        WHERE local_businesses_fts MATCH :match
+        ORDER BY rank LIMIT :limit
+    """, {"match": match, "limit": limit, "o": _MARK_OPEN, "c": _MARK_CLOSE})
+
+def search_items_like(db: Session, q: str, limit: int = 20, city: str | None = None, category: str | None = None) -> list[dict]:
+    """Ripiego senza FTS5 (DB non SQLite o SQLite compilato senza fts5)."""
+    tokens = [t for t in _TOKEN.findall(q or "") if t.lower() not in STOPWORDS] or _TOKEN.findall(q or "")
+    if not tokens:
+        return []
+    query = db.query(Item)
+    for tok in tokens:
+        query = query.filter(Item.title.ilike(f"%{tok}%") | Item.summary.ilike(f"%{tok}%"))
+    if city:
+        query = query.filter(Item.city.ilike(f"%{city}%"))
+    if category:
+        query = query.filter(Item.category == category)
+    return [{
+        "id": i.id, "title": i.title, "url": i.url, "source": i.source, "city": i.city,
+        "category": i.category, "published_at": i.published_at, "image_url": i.image_url,
+        "title_html": escape(i.title or ""), "snippet_html": escape((i.summary or "")[:200]), "rank": 0.0,
+    } for i in query.order_by(Item.published_at.desc()).limit(limit).all()]
+
+def search(db: Session, q: str, scopes: tuple[str, ...] = SCOPES, limit: int = 20,
+           city: str | None = None, category: str | None = None, prefix: bool | None = None) -> dict[str, list[dict]]:
+    if not fts_available(db):
+        return {"items": search_items_like(db, q, limit, city, category)} if "items" in scopes else {}
+    results = {}
+    if "items" in scopes:
+        results["items"] = search_items(db, q, limit, city, category, prefix)
+    if "offers" in scopes:
+        results["offers"] = search_offers(db, q, limit, prefix)
+    if "businesses" in scopes:
+        results["businesses"] = search_businesses(db, q, limit, prefix)
+    return results
@@ -1,14 +1,169 @@
-import feedparser, httpx, json, re
+import asyncio, feedparser, hashlib, httpx, json, multiprocessing, os, re
 from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import List, Dict, Iterable
+from urllib.parse import urlsplit
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
     "Accept-Language": "it-IT,it;q=0.9,en-US;q=0.8,en;q=0.7",
 }
 
-async def fetch_rss(url: str) -> List[Dict]:
-    feed = feedparser.parse(url)
+# Sessione HTTP condivisa da tutti i crawler (pool di connessioni keep-alive)
+CRAWLER_TIMEOUT = float(os.getenv("CRAWLER_TIMEOUT", "20") or 20)
+CRAWLER_MAX_CONNECTIONS = max(int(os.getenv("CRAWLER_MAX_CONNECTIONS", "20") or 20), 1)
+CRAWLER_PER_HOST = max(int(os.getenv("CRAWLER_PER_HOST", "2") or 2), 1)
+CRAWLER_KEEPALIVE_EXPIRY = float(os.getenv("CRAWLER_KEEPALIVE_EXPIRY", "300") or 300)
+CRAWLER_HTTP2 = os.getenv("CRAWLER_HTTP2", "true").lower() in {"1", "true", "yes"}
+
+# Parsing HTML/RSS (CPU-bound) in processi separati: non occupa il GIL dell'API.
+# 0 = nei thread del processo corrente
+PARSE_PROCESSES = max(int(os.getenv("PARSE_PROCESSES", str(min(os.cpu_count() or 1, 4))) or 0), 0)
+# Backend di BeautifulSoup: auto = lxml se installato, altrimenti html.parser
+HTML_PARSER = os.getenv("HTML_PARSER", "auto")
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (installato con `pip install httpx[http2]`)
+    except ImportError:
+        return False
+    return True
+
+def get_client() -> httpx.AsyncClient:
+    """Restituisce il client condiviso, creandolo al primo uso nell'event loop corrente."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=CRAWLER_TIMEOUT,
+            headers=HEADERS,
+            follow_redirects=True,
+            http2=CRAWLER_HTTP2 and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=CRAWLER_MAX_CONNECTIONS,
+                max_keepalive_connections=CRAWLER_MAX_CONNECTIONS,
+                keepalive_expiry=CRAWLER_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _client_loop = loop
+        _host_limits.clear()
+    return _client
+
+async def close_client() -> None:
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+    _host_limits.clear()
+
+_parse_pool: ProcessPoolExecutor | None = None
+
+def get_parse_pool() -> ProcessPoolExecutor | None:
+    global _parse_pool
+    if PARSE_PROCESSES and _parse_pool is None:
+        # spawn: il processo API ha thread ed event loop attivi, fork non è sicuro
+        _parse_pool = ProcessPoolExecutor(PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _parse_pool
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
+async def run_parser(parser, *args):
+    """Esegue un parser (funzione di modulo, argomenti serializzabili) nel pool di processi."""
+    pool = get_parse_pool()
+    if pool is None:
+        return await asyncio.to_thread(parser, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, parser, *args)
+    except BrokenProcessPool:
+        # Un worker è morto (es. OOM): il prossimo parsing ricrea il pool
+        shutdown_parse_pool()
+        raise
+
+async def http_get(url: str, state: Dict | None = None) -> httpx.Response | None:
+    """GET tramite il client condiviso, con limite di richieste simultanee per host.
+
+    Se viene passato `state` (etag, last_modified, content_hash) la richiesta è
+    condizionale: restituisce None quando la fonte non è cambiata (304 o stesso
+    hash del corpo) e aggiorna `state` in-place altrimenti. In `state` finiscono
+    anche stato HTTP e byte ricevuti (per le metriche, non salvati in fetch_state).
+    """
+    client = get_client()
+    host = urlsplit(url).netloc.lower()
+    headers = {}
+    if state is not None:
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+    sem = _host_limits.setdefault(host, asyncio.Semaphore(CRAWLER_PER_HOST))
+    async with sem:
+        r = await client.get(url, headers=headers)
+    if state is not None:
+        state["status"] = r.status_code
+        state["bytes"] = len(r.content)
+    if state is not None and r.status_code == 304:
+        return None
+    r.raise_for_status()
+    if state is not None:
+        content_hash = hashlib.sha256(r.content).hexdigest()
+        unchanged = content_hash == state.get("content_hash")
+        state["etag"] = r.headers.get("etag", "")
+        state["last_modified"] = r.headers.get("last-modified", "")
+        state["content_hash"] = content_hash
+        if unchanged:
+            return None
+    return r
+
+def _select_backend() -> str:
+    if HTML_PARSER != "auto":
+        return HTML_PARSER
+    try:
+        import lxml  # noqa: F401  (opzionale: `pip install lxml`, molto più veloce di html.parser)
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+_BACKEND = _select_backend()
+
+def make_soup(markup: str | bytes) -> BeautifulSoup:
+    return BeautifulSoup(markup, _BACKEND)
+
+def html_to_text(text: str | None) -> str:
+    """Testo semplice da un frammento HTML; senza tag né entità non costruisce alcun albero."""
+    if not text:
+        return ""
+    if "<" not in text and "&" not in text:
+        return text.strip()
+    return make_soup(text).get_text(separator=" ", strip=True)
+
+def _fragment(text: str | None) -> tuple[str, str]:
+    """Un solo parsing del frammento: (testo, src della prima immagine)."""
+    if not text:
+        return "", ""
+    if "<" not in text and "&" not in text:
+        return text.strip(), ""
+    soup = make_soup(text)
+    img = soup.find("img", src=True)
+    return soup.get_text(separator=" ", strip=True), (img["src"] if img else "")
+
+def parse_rss(content: bytes, response_headers: Dict | None = None) -> List[Dict]:
+    """Parsing sincrono del feed già scaricato: va eseguito fuori dall'event loop.
+
+    Ogni entry è analizzata una sola volta: titolo e summary escono già come
+    testo semplice e l'immagine viene presa dallo stesso albero del summary.
+    """
+    # Gli header (content-location, content-type) servono a risolvere link relativi ed encoding
+    feed = feedparser.parse(content, response_headers=response_headers or {})
     items = []
     for e in feed.entries[:50]:
         # Extract image URL from RSS entry
@@ -39,82 +194,166 @@ async def fetch_rss(url: str) -> List[Dict]:
         if not image_url and hasattr(e, 'content'):
             for content in e.content:
                 if hasattr(content, 'value'):
-                    soup = BeautifulSoup(content.value, 'html.parser')
-                    img = soup.find('img')
-                    if img and img.get('src'):
-                        image_url = img['src']
+                    _, image_url = _fragment(content.value)
+                    if image_url:
                         break
 
-        # Try summary with images
-        if not image_url and hasattr(e, 'summary'):
-            soup = BeautifulSoup(e.summary, 'html.parser')
-            img = soup.find('img')
-            if img and img.get('src'):
-                image_url = img['src']
+        # Summary: testo e (se manca ancora) immagine dallo stesso parsing
+        summary, summary_image = _fragment(getattr(e, "summary", ""))
+        image_url = image_url or summary_image
 
         items.append({
-            "title": getattr(e, "title", ""),
+            "title": html_to_text(getattr(e, "title", "")),
             "url": getattr(e, "link", ""),
-            "summary": getattr(e, "summary", ""),
+            "summary": summary,
             "published_at": getattr(e, "published_parsed", None),
             "image_url": image_url,
         })
     return items
 
-def _extract_json_array(text: str, required_keys: Iterable[str]) -> List[dict]:
-    required_keys = set([k for k in required_keys if k])
-    idx = 0
+async def fetch_document(url: str, state: Dict | None = None) -> Dict | None:
+    """Scarica una fonte e restituisce un documento serializzabile da passare ai parser.
+
+    Il documento contiene solo tipi semplici (bytes/str), così il parsing può
+    girare in un altro thread o processo; i suggerimenti salvati nello stato
+    (es. `json_offset`) viaggiano con il documento. None se la fonte non è cambiata.
+    """
+    r = await http_get(url, state)
+    if r is None:
+        return None
+    return {
+        "url": str(r.url),
+        "content": r.content,
+        "encoding": r.encoding or "utf-8",
+        "content_type": r.headers.get("content-type", ""),
+        "json_offset": (state or {}).get("json_offset"),
+    }
+
+def parse_rss_document(doc: Dict, rules: dict | None = None) -> tuple[List[Dict], Dict]:
+    # Gli header (content-location, content-type) servono a risolvere link relativi ed encoding
+    return parse_rss(doc["content"], {"content-location": doc["url"], "content-type": doc["content_type"]}), {}
+
+async def fetch_rss(url: str, state: Dict | None = None) -> List[Dict] | None:
+    doc = await fetch_document(url, state)
+    if doc is None:
+        return None
+    items, _ = await run_parser(parse_rss_document, doc)
+    return items
+
+_SCRIPT_BODY = re.compile(r"<script\b[^>]*>(.*?)</script\s*>", re.S | re.I)
+# Un array JSON di oggetti inizia con `[{"` (o `[{}`): i letterali JS con chiavi
+# non quotate (`[{id:1}]`) si scartano qui, senza tentare la decodifica
+_ARRAY_START = re.compile(r'\[\s*\{\s*["}]')
+_JSON_DECODER = json.JSONDecoder()
+# Ampiezza (in caratteri) della zona intorno all'offset del run precedente
+JSON_HINT_WINDOW = 4096
+# Prima finestra di decodifica di un candidato (si allarga se il valore non ci sta)
+JSON_DECODE_WINDOW = 1024
+
+def _find_list(value, required_keys: set[str]) -> list | None:
+    """Prima lista (in ordine di documento) con almeno un oggetto che ha tutte le chiavi richieste."""
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            if not required_keys or any(isinstance(e, dict) and required_keys <= e.keys() for e in node):
+                return node
+            stack.extend(v for v in reversed(node) if isinstance(v, (list, dict)))
+        else:
+            stack.extend(v for v in reversed(list(node.values())) if isinstance(v, (list, dict)))
+    return None
+
+def _decode_at(text: str, pos: int, end: int) -> tuple[object, int]:
+    """Decodifica il valore JSON che inizia in `pos`: (valore, fine) o (None, posizione dell'errore).
+
+    Non si passa mai la pagina intera a raw_decode: ogni JSONDecodeError conta
+    le righe dall'inizio del documento, quindi il costo di un candidato non
+    valido sarebbe proporzionale alla sua posizione nella pagina. Si decodifica
+    una finestra che si allarga (×16) finché il valore non ci sta; un NUL in coda fa
+    fallire un valore troncato proprio sul bordo della finestra, così si
+    distingue da un errore vero (che ferma la ricerca lì).
+    """
+    size = JSON_DECODE_WINDOW
     while True:
-        idx = text.find("[{", idx)
-        if idx == -1:
-            break
-        depth = 0
-        in_string = False
-        escape = False
-        for pos in range(idx, len(text)):
-            ch = text[pos]
-            if in_string:
-                if escape:
-                    escape = False
-                elif ch == "\\":
-                    escape = True
-                elif ch == "\"":
-                    in_string = False
-            else:
-                if ch == "\"":
-                    in_string = True
-                elif ch in "[{":
-                    depth += 1
-                elif ch in "]}":
-                    depth -= 1
-                    if depth == 0:
-                        candidate = text[idx:pos + 1]
-                        try:
-                            data = json.loads(candidate)
-                        except json.JSONDecodeError:
-                            break
-                        if isinstance(data, list):
-                            if not required_keys:
-                                return data
-                            for entry in data:
-                                if isinstance(entry, dict) and required_keys.issubset(entry.keys()):
-                                    return data
-                        break
-        idx += 2
-    return []
+        stop = min(pos + size, end)
+        chunk = text[pos:stop]
+        truncated = stop < end
+        try:
+            value, length = _JSON_DECODER.raw_decode(chunk + "\0" if truncated else chunk)
+            return value, pos + length
+        except ValueError as e:
+            at = getattr(e, "pos", 0)
+        except RecursionError:
+            # Annidamento oltre il limite di ricorsione: nessuna pagina reale, si salta la finestra
+            return None, stop
+        # Errori a ridosso del bordo (anche un \uXXXX o un `true` spezzati): la finestra era corta
+        if truncated and at >= len(chunk) - 6:
+            size *= 16
+            continue
+        return None, pos + max(at, 1)
 
-async def fetch_html_list(url: str, rules: dict) -> List[Dict]:
-    async with httpx.AsyncClient(timeout=20, headers=HEADERS, follow_redirects=True) as client:
-        r = await client.get(url)
-        r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-    base_url = r.url
+def _decode_arrays(text: str, start: int, end: int, required_keys: set[str], limit: int | None = None) -> tuple[list | None, int]:
+    # Candidati che iniziano in [start, end); il valore può arrivare fino a `limit` (default `end`)
+    # Lineare: dopo un valore decodificato si riprende dalla sua fine (le liste
+    # annidate le cerca _find_list sull'oggetto Python), dopo un candidato non
+    # valido dal punto dell'errore (i candidati in mezzo fallirebbero allo stesso modo
+    # o sono già stati letti), quindi ogni tratto di pagina si decodifica una volta sola
+    # (più un terzo al più, con le finestre che si allargano)
+    limit = end if limit is None else limit
+    resume = start
+    for m in _ARRAY_START.finditer(text, start, end):
+        if m.start() < resume:
+            continue
+        value, resume = _decode_at(text, m.start(), limit)
+        if value is None:
+            continue
+        found = _find_list(value, required_keys)
+        if found is not None:
+            return found, m.start()
+    return None, -1
+
+def extract_json_array(text: str, required_keys: Iterable[str], hint: int | None = None) -> tuple[List[dict], int | None]:
+    """Trova l'array JSON incorporato nella pagina (tipicamente in uno <script> di una SPA).
+
+    Restituisce (array, offset): l'offset va salvato e ripassato come `hint`
+    al run successivo, così la ricerca parte da lì invece che da inizio pagina.
+    """
+    required = {k for k in required_keys if k}
+    if hint is not None and 0 <= hint < len(text):
+        found, at = _decode_arrays(text, max(hint - JSON_HINT_WINDOW, 0), min(hint + JSON_HINT_WINDOW, len(text)), required, len(text))
+        if found is not None:
+            return found, at
+    outside, last = [], 0
+    for script in _SCRIPT_BODY.finditer(text):
+        found, at = _decode_arrays(text, script.start(1), script.end(1), required)
+        if found is not None:
+            return found, at
+        outside.append((last, script.start(1)))
+        last = script.end(1)
+    outside.append((last, len(text)))
+    # JSON fuori da <script> (es. pagine che lo stampano in un attributo o nel corpo):
+    # solo le parti non ancora esaminate
+    for start, end in outside:
+        found, at = _decode_arrays(text, start, end, required)
+        if found is not None:
+            return found, at
+    return [], None
+
+def parse_html_list(text: str, url: str, rules: dict, hints: Dict | None = None) -> List[Dict]:
+    """Estrae gli elementi da una pagina HTML secondo le regole (selettori CSS o JSON incorporato).
+
+    `hints` (facoltativo) porta l'offset dell'array JSON trovato al run
+    precedente ed è aggiornato in-place con quello nuovo.
+    """
+    soup = make_soup(text)
+    base_url = httpx.URL(url)
     items = []
     for node in soup.select(rules.get("item_selector", ""))[:50]:
         title_node = node.select_one(rules.get("title_selector", ""))
         if not title_node and rules.get("title_selector", "").strip() == node.name:
             title_node = node
-        link_node = node.select_one(rules.get("title_selector", "")) or node.select_one("a")
+        link_node = title_node if title_node is not node else None
+        link_node = link_node or node.select_one("a")
         if not link_node and rules.get("title_selector", "").strip() == node.name:
             link_node = node
         summary_node = node.select_one(rules.get("summary_selector", ""))
@@ -183,7 +422,8 @@ async def fetch_html_list(url: str, rules: dict) -> List[Dict]:
     json_title = rules.get("json_title_key")
     json_url = rules.get("json_url_key")
     if json_title and json_url:
-        json_entries = _extract_json_array(r.text, [json_title, json_url])
+        hints = hints if hints is not None else {}
+        json_entries, hints["json_offset"] = extract_json_array(text, [json_title, json_url], hints.get("json_offset"))
         if json_entries:
             out = []
             json_summary = rules.get("json_summary_key")
@@ -211,7 +451,7 @@ async def fetch_html_list(url: str, rules: dict) -> List[Dict]:
                 summary_val = entry.get(json_summary, "") if json_summary else ""
                 summary = ""
                 if summary_val:
-                    summary = BeautifulSoup(str(summary_val), "html.parser").get_text(" ", strip=True)
+                    summary = html_to_text(str(summary_val))
                 if location and summary:
                     if location.lower() not in summary.lower():
                         summary = f"{summary} — {location}"
@@ -223,3 +463,17 @@ async def fetch_html_list(url: str, rules: dict) -> List[Dict]:
             if out:
                 return out
     return []
+
+def parse_html_document(doc: Dict, rules: dict) -> tuple[List[Dict], Dict]:
+    hints = {"json_offset": doc.get("json_offset")}
+    items = parse_html_list(doc["content"].decode(doc["encoding"], errors="replace"), doc["url"], rules, hints)
+    return items, hints
+
+async def fetch_html_list(url: str, rules: dict, state: Dict | None = None) -> List[Dict] | None:
+    doc = await fetch_document(url, state)
+    if doc is None:
+        return None
+    items, hints = await run_parser(parse_html_document, doc, rules)
+    if state is not None:
+        state.update(hints)
+    return items
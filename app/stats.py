@@ -0,0 +1,83 @@
+"""Contatori della home admin (/admin) letti con una sola query.
+
+Su SQLite i valori stanno in `stats_counters`, tenuta allineata da trigger
+(migrazione 0011): ingest, endpoint admin e qualsiasi altra scrittura li
+aggiornano nella stessa transazione, e leggerli costa poche righe per
+chiave primaria qualunque sia la dimensione di `items`. Se la tabella non ha
+tutti i contatori (altri DB, contatore aggiunto senza migrazione) si ripiega
+su un'unica SELECT con le count() come subquery.
+
+Il risultato resta in memoria ADMIN_STATS_TTL secondi e si scarta a ogni
+`invalidate_content()`. Le scritture che toccano solo i contatori (richieste
+sponsor) usano `invalidate_stats()`: svuota la cache del processo corrente,
+gli altri processi si riallineano entro ADMIN_STATS_TTL.
+"""
+import os, threading, time
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from .cache import register_cache
+from .models import StatCounter
+
+ADMIN_STATS_TTL = float(os.getenv("ADMIN_STATS_TTL", "10") or 0)
+
+# nome -> (tabella, condizione come (colonna, valore SQL) o None per tutte le righe)
+COUNTERS: dict[str, tuple[str, tuple[str, str] | None]] = {
+    "pending_ads": ("ad_requests", ("status", "'pending'")),
+    "active_ads": ("ads", ("active", "1")),
+    "pending_offers": ("service_offers", ("status", "'pending'")),
+    "published_offers": ("service_offers", ("status", "'published'")),
+    "total_offers": ("service_offers", None),
+    "businesses": ("local_businesses", None),
+    "highlighted_businesses": ("local_businesses", ("highlighted", "1")),
+    "total_items": ("items", None),
+}
+
+def condition(cond: tuple[str, str] | None, prefix: str = "") -> str:
+    """Condizione SQL del contatore; `prefix` = "new."/"old." nei trigger."""
+    if cond is None:
+        return "1"
+    column, value = cond
+    return f"{prefix}{column} = {value}"
+
+def _aggregate_sql():
+    parts = [
+        f"(SELECT count(*) FROM {table} WHERE {condition(cond)}) AS {name}"
+        for name, (table, cond) in COUNTERS.items()
+    ]
+    return text("SELECT " + ", ".join(parts))
+
+class _StatsCache:
+    def __init__(self):
+        self._value: dict | None = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        register_cache(self)
+
+    def get(self) -> dict | None:
+        with self._lock:
+            return self._value if self._expires_at > time.monotonic() else None
+
+    def set(self, value: dict) -> None:
+        with self._lock:
+            self._value = value
+            self._expires_at = time.monotonic() + ADMIN_STATS_TTL
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+
+_cache = _StatsCache()
+
+def invalidate_stats() -> None:
+    _cache.invalidate()
+
+def admin_stats(db: Session) -> dict[str, int]:
+    stats = _cache.get()
+    if stats is not None:
+        return stats
+    rows = dict(db.execute(select(StatCounter.name, StatCounter.value)).all())
+    if not COUNTERS.keys() <= rows.keys():
+        rows = dict(db.execute(_aggregate_sql()).mappings().one())
+    stats = {name: max(int(rows[name] or 0), 0) for name in COUNTERS}
+    _cache.set(stats)
+    return stats
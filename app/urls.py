@@ -0,0 +1,41 @@
+"""Forma canonica degli URL degli item (chiave di deduplica, indice univoco su items.url).
+
+La usano l'ingest per ogni elemento e la migrazione 0012 per le righe salvate
+prima che esistesse.
+"""
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Parametri di tracking rimossi dagli URL prima del controllo duplicati (oltre a utm_*)
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "xtor"}
+# Frammenti aggiunti da widget di condivisione e browser, non dal sito:
+# `#sthash.XXXX.dpuf` (ShareThis), `#:~:text=...` (text fragment)
+TRACKING_FRAGMENTS = ("sthash.", ":~:")
+
+def _is_tracking(key: str) -> bool:
+    key = key.lower()
+    return key.startswith("utm_") or key in TRACKING_PARAMS
+
+def _is_tracking_fragment(fragment: str) -> bool:
+    if not fragment or fragment.lower().startswith(TRACKING_FRAGMENTS):
+        return True
+    # `#xtor=RSS-1`, `#utm_source=...`: solo parametri di tracking
+    params = parse_qsl(fragment, keep_blank_values=True)
+    return bool(params) and "=" in fragment and all(_is_tracking(k) for k, _ in params)
+
+def normalize_url(url: str) -> str:
+    """Schema e host in minuscolo, senza parametri né frammenti di tracking.
+
+    Il frammento resta negli altri casi: sui siti con routing lato client
+    (`/#/evento/123`) è l'unica parte che distingue una pagina dall'altra.
+    """
+    url = (url or "").strip()
+    if not url:
+        return ""
+    parts = urlsplit(url)
+    query = parts.query
+    params = parse_qsl(query, keep_blank_values=True)
+    kept = [(k, v) for k, v in params if not _is_tracking(k)]
+    if len(kept) != len(params):
+        query = urlencode(kept)
+    fragment = "" if _is_tracking_fragment(parts.fragment) else parts.fragment
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, fragment))
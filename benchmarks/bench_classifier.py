@@ -0,0 +1,89 @@
+"""Micro-benchmark di app.ranking.classify_and_score.
+
+Confronta il classificatore compilato con l'implementazione originale
+(una re.search per keyword per item) e verifica che diano lo stesso esito,
+anche con keyword che sono una il prefisso dell'altra ("festa", "festa della")
+e dopo una ricompilazione con reload_classifier().
+
+    python -m benchmarks.bench_classifier --items 20000
+"""
+import argparse, os, random, re, time
+from app.ranking import KEYWORDS, classify_and_score, reload_classifier
+
+WORDS = (
+    "comune fiumicino notizie roma lazio servizio cittadini scuola strada mare porto aeroporto "
+    "sindaco consiglio progetto lavori piazza parco centro cultura sport famiglie giovani"
+).split()
+
+# Keyword sovrapposte: nello stesso punto il lookahead ne trova una sola
+OVERLAPPING = {
+    "eventi": ["festa", "festa della musica", "sagra"],
+    "lavoro": ["festa della", "offerta", "offerta di lavoro", "lavoro"],
+    "annunci": ["offerta di", "vendo"],
+}
+OVERLAPPING_TEXTS = [
+    "Festa della musica a Fiumicino", "festa dellamusica", "Offerta di lavoro: cercasi", "offerta di",
+    "la festa, della sagra", "vendo offerta di lavoro festa della festa", "sagra della festa",
+]
+
+def legacy_classify_and_score(title: str, summary: str, keywords=KEYWORDS) -> dict:
+    text = f"{title} {summary}".lower()
+    best_cat, best_score = "altro", 0.0
+    for cat, kws in keywords.items():
+        score = 0.0
+        for kw in kws:
+            if re.search(r"\b" + re.escape(kw) + r"\b", text):
+                score += 1.0
+        if score > best_score:
+            best_score, best_cat = score, cat
+    city = os.getenv("CITY", "Fiumicino").lower()
+    if city in text:
+        best_score += 0.5
+    return {"category": best_cat, "score": float(best_score)}
+
+def make_corpus(n: int, seed: int = 42) -> list[tuple[str, str]]:
+    rnd = random.Random(seed)
+    keywords = [kw for kws in KEYWORDS.values() for kw in kws]
+    corpus = []
+    for _ in range(n):
+        words = rnd.choices(WORDS, k=rnd.randint(30, 80))
+        for _ in range(rnd.randint(0, 3)):
+            words.insert(rnd.randrange(len(words)), rnd.choice(keywords))
+        title = " ".join(words[:10]).capitalize()
+        corpus.append((title, " ".join(words[10:])))
+    return corpus
+
+def run(fn, corpus) -> float:
+    start = time.perf_counter()
+    for title, summary in corpus:
+        fn(title, summary)
+    return len(corpus) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.items)
+    mismatches = sum(1 for t, s in corpus if legacy_classify_and_score(t, s) != classify_and_score(t, s))
+    # Hot reload: keyword sovrapposte al posto di KEYWORDS, poi una keyword aggiunta al volo
+    original = {cat: list(kws) for cat, kws in KEYWORDS.items()}
+    reloads = [reload_classifier(OVERLAPPING)]
+    mismatches += sum(1 for t in OVERLAPPING_TEXTS if legacy_classify_and_score(t, "") != classify_and_score(t, ""))
+    KEYWORDS["eventi"].append("sagra della")
+    reloads += [reload_classifier(), not reload_classifier()]
+    mismatches += sum(1 for t in OVERLAPPING_TEXTS if legacy_classify_and_score(t, "") != classify_and_score(t, ""))
+    reloads.append(reload_classifier(original))
+    mismatches += sum(1 for t, s in corpus[:1000] if legacy_classify_and_score(t, s) != classify_and_score(t, s))
+    mismatches += reloads.count(False)
+    before = max(run(legacy_classify_and_score, corpus) for _ in range(args.repeat))
+    after = max(run(classify_and_score, corpus) for _ in range(args.repeat))
+    print(f"items:      {args.items}")
+    print(f"prima:      {before:,.0f} item/s")
+    print(f"dopo:       {after:,.0f} item/s")
+    print(f"speedup:    {after / before:.1f}x")
+    print(f"differenze: {mismatches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Carico e latenza degli endpoint FastAPI su un DB popolato.
+
+Popola un DB SQLite (temporaneo, o `--db` da riusare tra un run e l'altro)
+con i volumi richiesti e colpisce gli endpoint con N client concorrenti,
+in-process (httpx + ASGITransport, senza rete) o contro un uvicorn locale
+(`--server`, con `--workers` processi). Per ogni endpoint riporta p50, p95,
+p99 e richieste al secondo; i risultati si salvano in JSON e si confrontano
+tra commit con `--compare`.
+
+In-process client e app condividono l'event loop: i numeri includono il
+costo del client. Con `--server` si misura anche lo stack HTTP di uvicorn.
+`--cold` disattiva le cache di dashboard e feed (render completo a ogni
+richiesta).
+
+    python -m benchmarks.bench_http --items 100000 --db /tmp/bench.db --output /tmp/http.json
+    python -m benchmarks.bench_http --items 100000 --db /tmp/bench.db --server --workers 2 --compare /tmp/http.json
+"""
+import argparse, asyncio, math, os, random, shutil, signal, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+from benchmarks.results import compare_header, delta, load, new_report, save
+
+ENDPOINTS = [
+    "/dashboard",
+    "/dashboard?category=lavoro",
+    "/items?include_ads=true",
+    "/items?include_ads=true&category=eventi&limit=20",
+    "/api/offers",
+    "/api/businesses",
+    "/search?q=comune+fiumicino",
+    "/admin",
+]
+WORDS = (
+    "comune fiumicino notizie roma lazio servizio cittadini scuola strada mare porto aeroporto "
+    "sindaco consiglio progetto lavori piazza parco centro cultura sport famiglie giovani"
+).split()
+CITIES = ["Fiumicino", "Roma", "Lazio", "Ostia", "Ladispoli"]
+SEED_BATCH = 5000
+
+def seed(engine, args, rnd: random.Random) -> None:
+    """Inserimenti Core a blocchi (i trigger FTS restano attivi, come in produzione)."""
+    from sqlalchemy import insert
+    from app.models import Ad, AdRequest, Item, LocalBusiness, ServiceOffer
+    from app.ranking import KEYWORDS
+    categories = [*KEYWORDS.keys(), "altro"]
+    now = datetime.utcnow()
+
+    def text(n: int) -> str:
+        return " ".join(rnd.choices(WORDS, k=n))
+
+    def batches(total: int, make):
+        for start in range(0, total, SEED_BATCH):
+            yield [make(i) for i in range(start, min(start + SEED_BATCH, total))]
+
+    with engine.begin() as conn:
+        for rows in batches(args.items, lambda i: {
+            "source": f"fonte-{i % 40}",
+            "title": text(8).capitalize(),
+            "url": f"https://example.it/item/{i}",
+            "summary": text(40),
+            "city": rnd.choice(CITIES),
+            "category": rnd.choice(categories),
+            "published_at": now - timedelta(minutes=args.items - i),
+            "created_at": now - timedelta(minutes=args.items - i),
+            "score": round(rnd.random() * 3, 2),
+            "image_url": "",
+        }):
+            conn.execute(insert(Item), rows)
+        for rows in batches(args.ads, lambda i: {
+            "title": f"Sponsor {i}", "url": f"https://sponsor.example.it/{i}", "message": text(6),
+            "category": rnd.choice([*categories, "all", "all", "all"]), "city": "all", "active": i % 10 != 0,
+            "weight": rnd.choice([1.0, 1.0, 2.0, 5.0]), "show_in_feed": i % 7 != 0,
+            "sidebar_slot": ["left", "right", ""][i % 3] if i < 6 else "", "image_url": "",
+            "created_at": now - timedelta(hours=i),
+        }):
+            conn.execute(insert(Ad), rows)
+        for rows in batches(args.offers, lambda i: {
+            "title": f"Offerta {text(3)}", "description": text(30), "category": "altro", "city": rnd.choice(CITIES),
+            "zone": "", "contact_name": "Mario", "contact_method": "email", "rate": "", "available_from": None,
+            "available_to": None, "status": ["published", "published", "pending", "archived"][i % 4],
+            "highlighted": i % 25 == 0, "created_at": now - timedelta(hours=i),
+        }):
+            conn.execute(insert(ServiceOffer), rows)
+        for rows in batches(args.businesses, lambda i: {
+            "name": f"Attività {i}", "description": text(20), "category": "servizi", "address": "", "city": rnd.choice(CITIES),
+            "contact_name": "", "contact_phone": "", "contact_email": "", "website": "", "social_link": "",
+            "image_url": "", "highlighted": i % 20 == 0, "created_at": now - timedelta(hours=i),
+        }):
+            conn.execute(insert(LocalBusiness), rows)
+        for rows in batches(args.ad_requests, lambda i: {
+            "business_name": f"Attività {i}", "contact_person": "Anna", "email": f"a{i}@example.it", "phone": "",
+            "ad_type": "feed", "message": "", "status": ["pending", "contacted", "approved"][i % 3],
+            "created_at": now - timedelta(hours=i),
+        }):
+            conn.execute(insert(AdRequest), rows)
+
+def prepare_db(args) -> None:
+    from sqlalchemy import func, select
+    from app.db import Base, engine
+    from app.migrations import run_migrations
+    from app.models import Item
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(Item)).scalar()
+    if existing:
+        print(f"[=] DB già popolato ({existing} item): seed saltato")
+        return
+    start = time.perf_counter()
+    seed(engine, args, random.Random(args.seed))
+    print(f"[OK] Seed: {args.items} item, {args.ads} sponsor, {args.offers} offerte, {args.businesses} attività "
+          f"in {time.perf_counter() - start:.1f}s")
+    engine.dispose()
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(math.ceil(p / 100 * len(sorted_values)) - 1, 0))]
+
+async def drive(client, path: str, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in pending:
+            start = time.perf_counter()
+            try:
+                r = await client.get(path)
+                if r.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+async def run_load(client, args) -> dict:
+    results = {}
+    for path in args.endpoints:
+        await drive(client, path, args.warmup, min(args.concurrency, max(args.warmup, 1)))
+        results[path] = await drive(client, path, args.requests, args.concurrency)
+        r = results[path]
+        print(f"  {path:<50} {r['rps']:>8} req/s  p50 {r['p50_ms']:>8}ms  p95 {r['p95_ms']:>8}ms  p99 {r['p99_ms']:>8}ms"
+              + (f"  {r['errors']} errori" if r["errors"] else ""))
+    return results
+
+async def run_in_process(args) -> dict:
+    import httpx
+    from app.db import dispose_async_engine
+    from app.main import app
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await run_load(client, args)
+    finally:
+        await dispose_async_engine()
+
+async def run_against_server(args, env: dict) -> dict:
+    import httpx
+    port = args.port
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, env=env)
+    base = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+            deadline = time.monotonic() + 60
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn non è partito")
+                await asyncio.sleep(0.2)
+            return await run_load(client, args)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def compare(old: dict, new: dict) -> None:
+    compare_header(old, new)
+    for path, after in new["endpoints"].items():
+        before = old["endpoints"].get(path)
+        if not before:
+            continue
+        print(f"  {path:<50} req/s {delta(before['rps'], after['rps']):>7}  p50 {delta(before['p50_ms'], after['p50_ms']):>7}  "
+              f"p95 {delta(before['p95_ms'], after['p95_ms']):>7}  p99 {delta(before['p99_ms'], after['p99_ms']):>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--ads", type=int, default=200)
+    parser.add_argument("--offers", type=int, default=500)
+    parser.add_argument("--businesses", type=int, default=300)
+    parser.add_argument("--ad-requests", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="file SQLite da creare o riusare (default: temporaneo)")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=500, help="richieste misurate per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="richieste non misurate per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cold", action="store_true", help="cache di dashboard e feed disattivate")
+    parser.add_argument("--server", action="store_true", help="contro un uvicorn locale invece che in-process")
+    parser.add_argument("--workers", type=int, default=1, help="processi uvicorn (con --server)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="file JSON dove salvare i risultati")
+    parser.add_argument("--compare", help="JSON di un run precedente da confrontare con questo")
+    args = parser.parse_args()
+
+    # Prima di importare app.*: DB e cache si configurano all'import
+    workdir = None
+    db_path = args.db
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix="bench_http_")
+        db_path = os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    os.environ["ADMIN_TOKEN"] = ""
+    if args.cold:
+        os.environ["DASHBOARD_CACHE_TTL"] = "0"
+        os.environ["FEED_TTL"] = "0"
+
+    try:
+        prepare_db(args)
+        mode = f"uvicorn ({args.workers} worker)" if args.server else "in-process"
+        print(f"[i] {len(args.endpoints)} endpoint × {args.requests} richieste, concorrenza {args.concurrency}, {mode}"
+              + (", cache disattivate" if args.cold else ""))
+        if args.server:
+            endpoints = asyncio.run(run_against_server(args, dict(os.environ)))
+        else:
+            endpoints = asyncio.run(run_in_process(args))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = new_report(
+        {k: v for k, v in vars(args).items() if k not in {"output", "compare", "db", "port"}},
+        endpoints=endpoints,
+    )
+    if args.output:
+        save(report, args.output)
+    if args.compare:
+        compare(load(args.compare), report)
+
+if __name__ == "__main__":
+    main()
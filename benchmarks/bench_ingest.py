@@ -0,0 +1,289 @@
+"""Benchmark dell'ingest completo, offline.
+
+Un server HTTP locale serve al posto dei siti reali i campioni in
+`benchmarks/fixtures/` (un feed RSS e una lista HTML nel formato delle fonti
+configurate) moltiplicati fino a migliaia di entry, più pagine SPA di
+qualche MB con il JSON incorporato (le stesse di bench_json_island). Le fonti
+sintetiche si registrano con `register_source_type` e `ingest()` gira
+per intero (fetch → parse → normalize → classify → write) su un DB SQLite
+temporaneo.
+
+Per ogni run riporta item/s per stadio, tempo di scrittura sul DB, memoria
+di picco (RSS) e salva tutto in JSON, così due commit si confrontano con
+`--compare`. Il secondo run trova le fonti invariate (ETag → 304) e misura
+il costo di un ingest senza novità.
+
+    python -m benchmarks.bench_ingest --feeds 40 --entries 2000 --output /tmp/ingest.json
+    python -m benchmarks.bench_ingest --compare /tmp/ingest.json
+    python -m benchmarks.bench_ingest --record   # aggiorna i campioni dalle fonti reali
+"""
+import argparse, asyncio, hashlib, json, os, re, resource, shutil, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.results import compare_header, delta, load, new_report, save
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+RSS_FIXTURE = os.path.join(FIXTURES, "rss_feed.xml")
+HTML_FIXTURE = os.path.join(FIXTURES, "html_list.html")
+# Fonti reali da cui --record prende i campioni (nomi in app/sources/*.json)
+RECORD_RSS = "Comune di Fiumicino – Notizie"
+RECORD_HTML = "Città Metropolitana di Roma – Notizie"
+HTML_RULE = {
+    "item_selector": ".td_module_wrap",
+    "title_selector": "h3 a",
+    "url_selector": "h3 a::attr(href)",
+    "summary_selector": ".td-excerpt",
+    "image_selector": "img.entry-thumb",
+}
+SPA_RULE = {
+    "item_selector": "div.job-card",
+    "json_title_key": "jobTitle",
+    "json_url_key": "jobURL",
+    "json_summary_key": "publicDescription",
+    "json_filter_key": "jobLocation",
+    "json_filter_value": "Fiumicino",
+}
+RSS_ITEM = re.compile(r"<item\b.*?</item>", re.S)
+# URL da rendere unici in ogni copia: href, <link> e <guid> dei feed
+URL_SLOT = re.compile(r'(href="|<link>|<guid[^>]*>)([^"<]+)')
+
+def _unique_urls(block: str, tag: str) -> str:
+    def add(m: re.Match) -> str:
+        url = m.group(2)
+        return f"{m.group(1)}{url}{'&amp;' if '?' in url else '?'}bench={tag}"
+    return URL_SLOT.sub(add, block)
+
+def scale_rss(text: str, entries: int, source: int) -> str:
+    """Il feed registrato con `entries` item, ricavati ciclando quelli originali."""
+    blocks = RSS_ITEM.findall(text)
+    first, last = RSS_ITEM.search(text), list(RSS_ITEM.finditer(text))[-1]
+    copies = [_unique_urls(blocks[i % len(blocks)], f"{source}-{i}") for i in range(entries)]
+    return text[:first.start()] + "\n".join(copies) + text[last.end():]
+
+def scale_html(text: str, items: int, source: int) -> str:
+    """La pagina registrata con `items` blocchi in più prima del primo originale."""
+    from bs4 import BeautifulSoup
+    nodes = BeautifulSoup(text, "html.parser").select(HTML_RULE["item_selector"])
+    lines = text.splitlines(keepends=True)
+    start = sum(len(line) for line in lines[:nodes[0].sourceline - 1]) + nodes[0].sourcepos
+    copies = [_unique_urls(str(nodes[i % len(nodes)]), f"{source}-{i}") for i in range(items)]
+    return text[:start] + "\n".join(copies) + text[start:]
+
+def build_pages(args) -> dict[str, tuple[bytes, str]]:
+    from benchmarks.bench_json_island import make_page
+    with open(RSS_FIXTURE, encoding="utf-8") as f:
+        rss = f.read()
+    with open(HTML_FIXTURE, encoding="utf-8") as f:
+        html = f.read()
+    pages = {}
+    for n in range(args.feeds):
+        pages[f"/rss/{n}.xml"] = (scale_rss(rss, args.entries, n).encode(), "application/rss+xml; charset=utf-8")
+    for n in range(args.html_pages):
+        pages[f"/html/{n}/"] = (scale_html(html, args.html_items, n).encode(), "text/html; charset=utf-8")
+    for n in range(args.spa_pages):
+        # Link relativi alla pagina: ogni pagina SPA ha le sue offerte
+        spa = make_page(args.spa_mb, seed=n).replace('"jobURL": "/job/', '"jobURL": "job/')
+        pages[f"/spa/{n}/"] = (spa.encode(), "text/html; charset=utf-8")
+    return pages
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        page = self.server.pages.get(self.path)
+        if page is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body, content_type = page
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(pages: dict) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.pages = pages
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_configs(workdir: str, base: str, pages: dict) -> tuple[str, str]:
+    rss, html = [], []
+    for path in pages:
+        kind, n = path.strip("/").split("/")[:2]
+        n = n.split(".")[0]
+        if kind == "rss":
+            rss.append({"name": f"bench-rss-{n}", "url": base + path, "city": "Fiumicino"})
+        else:
+            rule = HTML_RULE if kind == "html" else SPA_RULE
+            html.append({"name": f"bench-{kind}-{n}", "url": base + path, "city": "Fiumicino", **rule})
+    paths = []
+    for name, rules in (("rss.json", rss), ("html.json", html)):
+        path = os.path.join(workdir, name)
+        with open(path, "w") as f:
+            json.dump(rules, f)
+        paths.append(path)
+    return paths[0], paths[1]
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss è in KiB su Linux, in byte su macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _workers_peak_rss_mb() -> list[float]:
+    """Picco di memoria di ogni processo del pool di parsing (VmHWM, solo Linux).
+
+    RUSAGE_CHILDREN non serve: conta solo i figli terminati e, dopo fork+exec,
+    parte dal picco del padre.
+    """
+    import multiprocessing
+    peaks = []
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            continue
+        peaks.append(round(kb / 1024, 1))
+    return sorted(peaks, reverse=True)
+
+async def run_ingest(runs: int) -> list[dict]:
+    from scripts.ingest import ingest
+    results = []
+    for n in range(runs):
+        start = time.perf_counter()
+        stats = await ingest()
+        wall = time.perf_counter() - start
+        stages = {}
+        for name, st in stats.get("stages", {}).items():
+            # Elementi prodotti dallo stadio (per la scrittura: righe ricevute) sul suo tempo totale
+            processed = st["out"] or st["in"]
+            stages[name] = {**st, "items_per_s": round(processed / st["wall_s"], 1) if st["wall_s"] else None}
+        write = stats.get("stages", {}).get("write", {})
+        results.append({
+            "run": n + 1,
+            "wall_s": round(wall, 3),
+            "sources": stats["sources"],
+            "unchanged": stats["unchanged"],
+            "errors": stats["errors"],
+            "parsed": stats["parsed"],
+            "inserted": stats["inserted"],
+            "items_per_s": round(stats["parsed"] / wall, 1) if wall else None,
+            "db_write_s": write.get("busy_s", 0.0),
+            "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+            "stages": stages,
+        })
+    return results
+
+def print_report(report: dict) -> None:
+    for run in report["runs"]:
+        print(f"\n[i] Run {run['run']}: {run['wall_s']}s, {run['sources']} fonti ({run['unchanged']} invariate, {run['errors']} errori), "
+              f"{run['parsed']} item ({run['items_per_s']}/s), {run['inserted']} nuovi, scrittura DB {run['db_write_s']}s, RSS {run['peak_rss_mb']} MB")
+        print(f"    {'stadio':<10} {'in':>7} {'out':>7} {'attivo':>8} {'totale':>8} {'item/s':>9}")
+        for name, st in run["stages"].items():
+            rate = "-" if st["items_per_s"] is None else f"{st['items_per_s']:.0f}"
+            print(f"    {name:<10} {st['in']:>7} {st['out']:>7} {st['busy_s']:>7.2f}s {st['wall_s']:>7.2f}s {rate:>9}")
+    if report["parse_workers_peak_rss_mb"]:
+        print(f"\n[i] RSS di picco dei processi di parsing (MB): {report['parse_workers_peak_rss_mb']}")
+
+def compare(old: dict, new: dict) -> None:
+    """Variazioni percentuali (run per run) delle metriche principali."""
+    compare_header(old, new)
+    for before, after in zip(old["runs"], new["runs"]):
+        print(f"  Run {after['run']}: totale {before['wall_s']}s → {after['wall_s']}s ({delta(before['wall_s'], after['wall_s'])}), "
+              f"item/s {delta(before['items_per_s'], after['items_per_s'])}, scrittura DB {delta(before['db_write_s'], after['db_write_s'])}, "
+              f"RSS {delta(before['peak_rss_mb'], after['peak_rss_mb'])}")
+        for name, st in after["stages"].items():
+            prev = before["stages"].get(name)
+            if prev and (prev["items_per_s"] or st["items_per_s"]):
+                print(f"    {name:<10} item/s {prev['items_per_s']} → {st['items_per_s']} ({delta(prev['items_per_s'], st['items_per_s'])})")
+
+def record() -> None:
+    """Scarica le fonti reali RECORD_RSS e RECORD_HTML nei file di fixture."""
+    import httpx
+    targets = {RECORD_RSS: ("app/sources/rss_list.json", RSS_FIXTURE), RECORD_HTML: ("app/sources/html_rules.json", HTML_FIXTURE)}
+    for name, (config, fixture) in targets.items():
+        with open(config) as f:
+            url = next(rule["url"] for rule in json.load(f) if rule["name"] == name)
+        r = httpx.get(url, follow_redirects=True, timeout=30, headers={"User-Agent": "LocalBrainBot/0.1 (+https://localbrain.it)"})
+        r.raise_for_status()
+        with open(fixture, "wb") as f:
+            f.write(r.content)
+        print(f"[OK] {name}: {len(r.content)} byte in {fixture}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, default=20, help="feed RSS (ognuno produce al più 50 item)")
+    parser.add_argument("--entries", type=int, default=1000, help="entry per feed")
+    parser.add_argument("--html-pages", type=int, default=20)
+    parser.add_argument("--html-items", type=int, default=500, help="blocchi per pagina HTML")
+    parser.add_argument("--spa-pages", type=int, default=4)
+    parser.add_argument("--spa-mb", type=float, default=2.0, help="dimensione delle pagine SPA")
+    parser.add_argument("--runs", type=int, default=2, help="run consecutivi sullo stesso DB (dal secondo le fonti sono invariate)")
+    parser.add_argument("--per-host", type=int, default=8, help="CRAWLER_PER_HOST: tutte le fonti sono sullo stesso host locale")
+    parser.add_argument("--output", help="file JSON dove salvare i risultati")
+    parser.add_argument("--compare", help="JSON di un run precedente da confrontare con questo")
+    parser.add_argument("--record", action="store_true", help="aggiorna i campioni scaricando le fonti reali ed esce")
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+        return
+
+    # Prima di importare app.*: DB e limiti del client si leggono all'import
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["CRAWLER_PER_HOST"] = str(args.per_host)
+    from app.sources.crawlers import close_client, parse_html_document, parse_rss_document, shutdown_parse_pool
+    from scripts.ingest import register_source_type
+
+    try:
+        start = time.perf_counter()
+        pages = build_pages(args)
+        size = sum(len(body) for body, _ in pages.values())
+        print(f"[i] {len(pages)} fonti sintetiche, {size / 2**20:.1f} MB in {time.perf_counter() - start:.1f}s")
+        server = start_server(pages)
+        rss_config, html_config = write_configs(workdir, f"http://127.0.0.1:{server.server_address[1]}", pages)
+        register_source_type("RSS", rss_config, parse_rss_document)
+        register_source_type("HTML", html_config, parse_html_document)
+
+        async def run() -> list[dict]:
+            try:
+                return await run_ingest(args.runs)
+            finally:
+                await close_client()
+
+        runs = asyncio.run(run())
+        workers_rss = _workers_peak_rss_mb()
+        shutdown_parse_pool()
+        server.shutdown()
+        report = new_report(
+            {k: v for k, v in vars(args).items() if k not in {"output", "compare", "record"}},
+            payload_mb=round(size / 2**20, 2),
+            runs=runs,
+            parse_workers_peak_rss_mb=workers_rss,
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        save(report, args.output)
+    if args.compare:
+        compare(load(args.compare), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Micro-benchmark di app.sources.crawlers.extract_json_array.
+
+Costruisce pagine "SPA" sintetiche di qualche MB (markup, bundle JS minificato
+con letterali `[{...}]` non JSON, stato JSON con molti array annidati e le
+offerte cercate in fondo) e confronta l'estrattore attuale, con e senza
+l'offset del run precedente, con l'implementazione originale (scansione
+carattere per carattere ripartita a ogni `[{`). Verifica che trovino lo stesso array.
+
+Misura poi le pagine patologiche: migliaia di candidati `[{"` che non sono
+JSON valido (`undefined`, due punti mancanti, stringhe non chiuse), dentro e
+fuori da <script>. Il tempo deve crescere in proporzione al numero di
+candidati: con 4x candidati ci si aspetta circa 4x, non 16x.
+
+    python -m benchmarks.bench_json_island --mb 1 2 4
+    python -m benchmarks.bench_json_island --skip-legacy --literals 5000 20000
+"""
+import argparse, json, random, time
+from app.sources.crawlers import extract_json_array
+
+KEYS = ["jobTitle", "jobURL"]
+
+def legacy_extract_json_array(text: str, required_keys) -> list[dict]:
+    required_keys = set([k for k in required_keys if k])
+    idx = 0
+    while True:
+        idx = text.find("[{", idx)
+        if idx == -1:
+            break
+        depth = 0
+        in_string = False
+        escape = False
+        for pos in range(idx, len(text)):
+            ch = text[pos]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == "\"":
+                    in_string = False
+            else:
+                if ch == "\"":
+                    in_string = True
+                elif ch in "[{":
+                    depth += 1
+                elif ch in "]}":
+                    depth -= 1
+                    if depth == 0:
+                        candidate = text[idx:pos + 1]
+                        try:
+                            data = json.loads(candidate)
+                        except json.JSONDecodeError:
+                            break
+                        if isinstance(data, list):
+                            if not required_keys:
+                                return data
+                            for entry in data:
+                                if isinstance(entry, dict) and required_keys.issubset(entry.keys()):
+                                    return data
+                        break
+        idx += 2
+    return []
+
+def make_page(mb: float, seed: int = 42) -> str:
+    rnd = random.Random(seed)
+    target = int(mb * 1024 * 1024)
+    markup = []
+    size = 0
+    while size < target * 0.4:
+        chunk = f'<div class="card c{rnd.randint(0, 99)}"><a href="/p/{rnd.randint(0, 10**6)}">Articolo {rnd.random():.6f}</a><p>testo di esempio</p></div>\n'
+        markup.append(chunk)
+        size += len(chunk)
+    bundle = []
+    size = 0
+    while size < target * 0.2:
+        # Letterali JS con chiavi non quotate, tipici dei bundle minificati; ogni tanto
+        # una stringa '[{' tra apici singoli, che l'implementazione originale segue fino a fine pagina
+        chunk = f"n.push([{{id:{rnd.randint(0, 999)},v:[{{k:'{rnd.random():.4f}'}}]}}]);"
+        if rnd.random() < 0.002:
+            chunk += "s=t.split('[{');"
+        bundle.append(chunk)
+        size += len(chunk)
+    records = []
+    size = 0
+    while size < target * 0.4:
+        rec = {"id": rnd.randint(0, 10**6), "tags": [{"t": "lavoro"}, {"t": "roma"}], "meta": {"rows": [{"r": rnd.random()}]}}
+        records.append(rec)
+        size += len(json.dumps(rec))
+    jobs = [
+        {"jobTitle": f"Operaio {i}", "jobURL": f"/job/{i}", "publicDescription": "<p>Turni</p>", "jobLocation": "Fiumicino"}
+        for i in range(50)
+    ]
+    state = {"props": {"pageProps": {"records": records, "jobs": jobs}}}
+    return (
+        "<html><head><script>" + "".join(bundle) + "</script></head><body>" + "".join(markup)
+        + '<script id="__NEXT_DATA__" type="application/json">' + json.dumps(state) + "</script></body></html>"
+    )
+
+PATHOLOGICAL = ['[{"a": undefined}]', '[{"a" 1}]', '[{"a": "x']
+
+def make_pathological_page(count: int, literal: str) -> str:
+    """Pagina con `count` candidati non validi, metà in uno <script> e metà nel corpo."""
+    half = "\n".join([literal] * (count // 2))
+    return f"<html><head><script>{half}</script></head><body>\n{half}\n</body></html>"
+
+def timed(fn, *args, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--literals", type=int, nargs="+", default=[5000, 20000], help="candidati delle pagine patologiche")
+    parser.add_argument("--skip-legacy", action="store_true", help="salta l'implementazione originale (lenta)")
+    args = parser.parse_args()
+
+    print(f"{'MB':>5} {'prima':>10} {'dopo':>10} {'con offset':>11} {'speedup':>8}  esito")
+    for mb in args.mb:
+        page = make_page(mb)
+        after, (found, offset) = timed(extract_json_array, page, KEYS, repeat=args.repeat)
+        hinted, (found_hinted, _) = timed(extract_json_array, page, KEYS, offset, repeat=args.repeat)
+        ok = found == found_hinted and len(found) == 50
+        if args.skip_legacy:
+            before, legacy = float("nan"), found
+        else:
+            before, legacy = timed(legacy_extract_json_array, page, KEYS, repeat=1)
+        ok = ok and legacy == found
+        print(f"{len(page) / 2**20:>5.1f} {before * 1000:>8.0f}ms {after * 1000:>8.1f}ms {hinted * 1000:>9.1f}ms "
+              f"{before / after:>7.0f}x  {'OK' if ok else 'DIVERSO'}")
+
+    print(f"\n{'letterale':<22} {'candidati':>9} {'KB':>7} {'tempo':>10} {'crescita':>9}  esito")
+    for literal in PATHOLOGICAL:
+        previous = None
+        for count in args.literals:
+            page = make_pathological_page(count, literal)
+            elapsed, (found, offset) = timed(extract_json_array, page, KEYS, repeat=args.repeat)
+            growth = f"{elapsed / previous[1]:.1f}x/{count / previous[0]:.0f}x" if previous else "-"
+            previous = (count, elapsed)
+            print(f"{literal!r:<22} {count:>9} {len(page) / 1024:>7.0f} {elapsed * 1000:>8.1f}ms {growth:>9}  "
+                  f"{'OK' if found == [] and offset is None else 'DIVERSO'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Risultati dei benchmark in JSON, confrontabili tra commit."""
+import json, platform, subprocess
+from datetime import datetime
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def new_report(params: dict, **fields) -> dict:
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": params,
+        **fields,
+    }
+
+def save(report: dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[OK] Risultati salvati in {path}")
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def delta(before, after) -> str:
+    """Variazione percentuale, '-' se non calcolabile."""
+    if not before or after is None:
+        return "-"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+def compare_header(old: dict, new: dict) -> None:
+    print(f"\n[i] Confronto {old.get('commit') or '?'} → {new.get('commit') or '?'}")
+    if old.get("params") != new.get("params"):
+        print("[WARN] Parametri diversi tra i due file: il confronto è indicativo")
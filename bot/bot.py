@@ -1,8 +1,13 @@
-import os, asyncio, logging
+import os, asyncio, logging, time
+from functools import wraps
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
-from app.db import SessionLocal
-from app.models import Item, Ad, ServiceOffer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import sync_content_version_async
+from app.db import AsyncSessionLocal, dispose_async_engine
+from app.feed import FEED_AD_FREQUENCY, feed_ads, interleave
+from app.metrics import Histogram, serve as serve_metrics
+from app.models import Item, ServiceOffer
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 from telegram.helpers import escape_markdown
@@ -11,6 +16,8 @@ load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ALLOWED = {u.strip() for u in os.getenv("TELEGRAM_ALLOWED_USER_IDS","").split(",") if u.strip()}
 LOG_PATH = os.getenv("BOT_LOG_PATH", "/tmp/localbrain_bot_app.log")
+# Porta HTTP delle metriche del bot (0 = disattivate)
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0") or 0)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -32,30 +39,40 @@ SERVICE_CATEGORY_LABELS = {
 }
 
 
+COMMAND_SECONDS = Histogram("bot_command_duration_seconds", "Latenza dei comandi del bot (risposta inclusa)", ("command",))
+
+def timed(command: str):
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            start = time.perf_counter()
+            try:
+                return await handler(update, context)
+            finally:
+                COMMAND_SECONDS.observe(time.perf_counter() - start, command=command)
+        return wrapper
+    return decorator
+
 def _escape(text: str) -> str:
     return escape_markdown(text or "", version=2)
 
-def _get_active_ads(db: Session):
-    return (
-        db.query(Ad)
-        .filter(Ad.active == True, Ad.show_in_feed == True)
-        .order_by(Ad.created_at.desc())
-        .all()
-    )
-
-def _interleave_ads(text_items: list[str], ads: list[Ad], every: int = 3) -> list[str]:
-    if not ads:
-        return text_items
+# Le query usano AsyncSession: un comando lento non blocca l'event loop del bot
+async def _feed_ads(db: AsyncSession) -> list[dict]:
+    """Sequenza pesata degli sponsor, la stessa del feed di API e dashboard (app/feed.py)."""
+    # L'ingest e l'admin girano in altri processi: la sequenza in memoria va riallineata
+    await sync_content_version_async()
+    return await feed_ads(db)
+
+def _interleave_ads(text_items: list[str], ads: list[dict], every: int = FEED_AD_FREQUENCY) -> list[str]:
     out: list[str] = []
-    ad_idx = 0
-    for i, chunk in enumerate(text_items, start=1):
-        out.append(chunk)
-        if i % every == 0:
-            ad = ads[ad_idx % len(ads)]
+    for entry in interleave(text_items, ads, every):
+        if entry["type"] == "item":
+            out.append(entry["record"])
+        else:
+            ad = entry["record"]
             out.append(
-                f"🔸 *Sponsorizzato*: [{_escape(ad.title)}]({ad.url})\n_{_escape(ad.message)}_\n\n"
+                f"🔸 *Sponsorizzato*: [{_escape(ad['title'])}]({ad['url']})\n_{_escape(ad['message'])}_\n\n"
             )
-            ad_idx += 1
     return out
 
 def check_auth(user_id: int) -> bool:
@@ -63,6 +80,7 @@ def check_auth(user_id: int) -> bool:
         return True
     return False
 
+@timed("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not check_auth(update.effective_user.id):
         logger.warning("Unauthorized start from %s", update.effective_user.id)
@@ -70,14 +88,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("Start requested by %s", update.effective_user.id)
     await update.message.reply_text("Benvenuto su LocalBrain — usa /latest per le novità e /cat <categoria>.")
 
+@timed("latest")
 async def latest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not check_auth(update.effective_user.id):
         logger.warning("Unauthorized latest from %s", update.effective_user.id)
         return
-    db: Session = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         logger.info("Fetching latest for %s", update.effective_user.id)
-        items = db.query(Item).order_by(Item.score.desc(), Item.created_at.desc()).limit(10).all()
+        items = (await db.scalars(select(Item).order_by(Item.score.desc(), Item.created_at.desc()).limit(10))).all()
         if not items:
             logger.info("No items found for latest request")
             await update.message.reply_text("Nessun elemento al momento. Esegui ingest e riprova.")
@@ -86,16 +104,15 @@ async def latest(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"• [{_escape(i.title)}]({i.url})\n_{_escape(i.category)} · {_escape(i.city)}_\n\n"
             for i in items
         ]
-        ads = _get_active_ads(db)
-        merged = _interleave_ads(chunks, ads, every=3)
-        output = "".join(merged)[:3800]
-        if not output:
-            output = "Nessun elemento al momento."
-        logger.info("Sending latest payload (%d chars, ads=%d)", len(output), len(ads))
-        await update.message.reply_markdown_v2(output, disable_web_page_preview=True)
-    finally:
-        db.close()
+        ads = await _feed_ads(db)
+    merged = _interleave_ads(chunks, ads)
+    output = "".join(merged)[:3800]
+    if not output:
+        output = "Nessun elemento al momento."
+    logger.info("Sending latest payload (%d chars, ads=%d)", len(output), len({ad["id"] for ad in ads}))
+    await update.message.reply_markdown_v2(output, disable_web_page_preview=True)
 
+@timed("cat")
 async def cat(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not check_auth(update.effective_user.id):
         logger.warning("Unauthorized cat from %s", update.effective_user.id)
@@ -104,16 +121,14 @@ async def cat(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Uso: /cat <lavoro|bandi|eventi|annunci|casa>")
         return
     sel = context.args[0]
-    db: Session = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         logger.info("Fetching cat=%s for %s", sel, update.effective_user.id)
-        items = (
-            db.query(Item)
-            .filter(Item.category == sel)
+        items = (await db.scalars(
+            select(Item)
+            .where(Item.category == sel)
             .order_by(Item.score.desc(), Item.created_at.desc())
             .limit(10)
-            .all()
-        )
+        )).all()
         if not items:
             logger.info("No items found for category %s", sel)
             await update.message.reply_text(f"Nessun elemento per categoria '{sel}'.")
@@ -122,55 +137,63 @@ async def cat(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"• [{_escape(i.title)}]({i.url})\n_{_escape(i.category)} · {_escape(i.city)}_\n\n"
             for i in items
         ]
-        ads = _get_active_ads(db)
-        merged = _interleave_ads(chunks, ads, every=3)
-        output = "".join(merged)[:3800]
-        if not output:
-            output = f"Nessun elemento per categoria '{_escape(sel)}'."
-        logger.info("Sending cat payload (%d chars, ads=%d)", len(output), len(ads))
-        await update.message.reply_markdown_v2(output, disable_web_page_preview=True)
-    finally:
-        db.close()
+        ads = await _feed_ads(db)
+    merged = _interleave_ads(chunks, ads)
+    output = "".join(merged)[:3800]
+    if not output:
+        output = f"Nessun elemento per categoria '{_escape(sel)}'."
+    logger.info("Sending cat payload (%d chars, ads=%d)", len(output), len({ad["id"] for ad in ads}))
+    await update.message.reply_markdown_v2(output, disable_web_page_preview=True)
 
 
 _format_range = lambda start, end: (f"{start.isoformat()} -> {end.isoformat()}" if start and end else (f"dal {start.isoformat()}" if start else (f"fino al {end.isoformat()}" if end else "")))
 
+@timed("offers")
 async def offers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not check_auth(update.effective_user.id):
         logger.warning("Unauthorized offers from %s", update.effective_user.id)
         return
-    db: Session = SessionLocal()
-    try:
-        offers = (
-            db.query(ServiceOffer)
-            .filter(ServiceOffer.status == "published")
+    async with AsyncSessionLocal() as db:
+        offers = (await db.scalars(
+            select(ServiceOffer)
+            .where(ServiceOffer.status == "published")
             .order_by(ServiceOffer.created_at.desc())
             .limit(5)
-            .all()
+        )).all()
+    if not offers:
+        await update.message.reply_text("Al momento non ci sono offerte pubblicate.")
+        return
+    lines = []
+    for off in offers:
+        category_label = SERVICE_CATEGORY_LABELS.get(off.category, off.category.title())
+        location_parts = [_escape(off.city)]
+        if off.zone:
+            location_parts.append(_escape(off.zone))
+        location_text = " · ".join(location_parts)
+        line = (
+            f"\u2022 *{_escape(off.title)}*\n_{category_label} · {location_text}_\n"
+            f"Referente: {_escape(off.contact_name)}\nContatto: {_escape(off.contact_method)}"
         )
-        if not offers:
-            await update.message.reply_text("Al momento non ci sono offerte pubblicate.")
-            return
-        lines = []
-        for off in offers:
-            category_label = SERVICE_CATEGORY_LABELS.get(off.category, off.category.title())
-            location_parts = [_escape(off.city)]
-            if off.zone:
-                location_parts.append(_escape(off.zone))
-            location_text = " · ".join(location_parts)
-            lines.append(
-                f"\u2022 *{_escape(off.title)}*\n_{category_label} · {location_text}_\nReferente: {_escape(off.contact_name)}\nContatto: {_escape(off.contact_method)}{f\'\nDisponibilità: {_escape(_format_range(off.available_from, off.available_to))}\' if off.available_from or off.available_to else ''}{f\'\nTariffa: {_escape(off.rate)}\' if off.rate else ''}\n\n"
-            )
-        payload = ''.join(lines)[:3800]
-        await update.message.reply_markdown_v2(payload, disable_web_page_preview=True)
-    finally:
-        db.close()
+        if off.available_from or off.available_to:
+            line += f"\nDisponibilità: {_escape(_format_range(off.available_from, off.available_to))}"
+        if off.rate:
+            line += f"\nTariffa: {_escape(off.rate)}"
+        lines.append(line + "\n\n")
+    payload = ''.join(lines)[:3800]
+    await update.message.reply_markdown_v2(payload, disable_web_page_preview=True)
+
+async def _close_db(app) -> None:
+    # Le connessioni aiosqlite hanno un thread ciascuna: vanno chiuse all'uscita
+    await dispose_async_engine()
 
 def main():
     if not BOT_TOKEN:
         raise RuntimeError("TELEGRAM_BOT_TOKEN non impostato in .env")
     logger.info("Starting LocalBrain bot")
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    if BOT_METRICS_PORT:
+        serve_metrics(BOT_METRICS_PORT)
+        logger.info("Metrics on port %d", BOT_METRICS_PORT)
+    app = ApplicationBuilder().token(BOT_TOKEN).post_shutdown(_close_db).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("latest", latest))
     app.add_handler(CommandHandler("cat", cat))
@@ -0,0 +1,161 @@
+"""Verifica con EXPLAIN QUERY PLAN che le query degli endpoint usino gli indici.
+
+Crea un DB SQLite temporaneo con create_all + migrazioni, lo popola con
+migliaia di righe su poche categorie e città, come in produzione, ed esegue
+ANALYZE: su tabelle vuote e senza statistiche il planner sceglie piani
+diversi da quelli reali. Fallisce (exit 1) se una query ordina con un
+B-tree temporaneo invece di leggere l'indice nell'ordine giusto, o se fa uno
+SCAN (tabella o indice letti dall'inizio, senza chiave di ricerca) che non è
+tra quelli accettati in ACCEPTED_SCANS.
+
+    python -m scripts.check_query_plans
+"""
+import random, re, sys
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, insert, select, text, true, tuple_
+from sqlalchemy.orm import Session
+from app.db import Base
+from app.feed import window_statement
+from app.migrations import run_migrations
+from app.models import Item, Ad, ServiceOffer, LocalBusiness
+
+# SCAN senza chiave: anche `SCAN t USING [COVERING] INDEX i` legge l'indice
+# dall'inizio; solo SEARCH ... (col=?) usa l'indice per cercare
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$")
+# Scansioni note, per query: dettaglio esatto del piano e perché va bene.
+# Se il planner cambia indice o piano il controllo torna a fallire
+ACCEPTED_SCANS = {
+    "/items, /dashboard": ("SCAN items USING INDEX ix_items_published_at",
+                           "indice in ordine di data, si ferma dopo LIMIT righe"),
+    "/items?city, /dashboard?city": ("SCAN items USING INDEX ix_items_published_at",
+                                     "ilike '%città%' non può usare un indice: ordine di data fino a LIMIT corrispondenze"),
+    "/dashboard cities": ("SCAN items USING COVERING INDEX ix_items_city",
+                          "legge solo l'indice delle città; il rendering della dashboard è in cache"),
+    "feed": ("SCAN items USING INDEX ix_items_published_at", "finestra FEED_WINDOW in ordine di data"),
+    "feed?city": ("SCAN items USING INDEX ix_items_published_at",
+                  "ilike sulla città: ordine di data fino a FEED_WINDOW corrispondenze, poi in cache"),
+    "bot /latest": ("SCAN items USING INDEX ix_items_score_created_at", "indice in ordine di punteggio, LIMIT 10"),
+}
+# Righe inserite prima di ANALYZE
+SEED_ITEMS = 20000
+SEED_OFFERS = 2000
+SEED_BUSINESSES = 1000
+SEED_ADS = 50
+
+def endpoint_queries():
+    """Le query (filtro + ordinamento) eseguite dagli endpoint più usati."""
+    items_by_date = select(Item).order_by(Item.published_at.desc())
+    items_by_score = select(Item).order_by(Item.score.desc(), Item.created_at.desc())
+    cursor = tuple_(datetime(2025, 1, 1), 1000)
+    keyset = tuple_(Item.published_at, Item.id)
+    feed_ads = select(Ad).where(Ad.active == true(), Ad.show_in_feed == true()).order_by(Ad.created_at.desc())
+    return {
+        "/items, /dashboard": items_by_date.limit(50),
+        "/items?category, /dashboard?category": items_by_date.where(Item.category == "lavoro").limit(50),
+        "/items?city, /dashboard?city": items_by_date.where(Item.city.ilike("%fiumicino%")).limit(50),
+        "/dashboard cities": select(Item.city).distinct(),
+        "/dashboard ads": select(Ad).where(Ad.active == true()).order_by(Ad.created_at.desc()),
+        "/items?include_ads, bot ads": feed_ads,
+        "/dashboard offerte in evidenza": select(ServiceOffer)
+            .where(ServiceOffer.status == "published")
+            .order_by(ServiceOffer.highlighted.desc(), ServiceOffer.created_at.desc())
+            .limit(3),
+        "/offers, /api/offers, bot /offers": select(ServiceOffer)
+            .where(ServiceOffer.status == "published")
+            .order_by(ServiceOffer.created_at.desc())
+            .limit(50),
+        # Feed in memoria (app/feed.py): finestra degli item per (città, categoria)
+        "feed": window_statement(None, None),
+        "feed?category": window_statement(None, "lavoro"),
+        "feed?city": window_statement("fiumicino", None),
+        "feed?city&category": window_statement("fiumicino", "lavoro"),
+        # Oltre la finestra: keyset sul DB (app/pagination.py), con gli stessi filtri
+        "/items?cursor": select(Item)
+            .where(keyset < cursor)
+            .order_by(Item.published_at.desc(), Item.id.desc())
+            .limit(51),
+        "/items?cursor&category": select(Item)
+            .where(Item.category == "lavoro")
+            .where(keyset < cursor)
+            .order_by(Item.published_at.desc(), Item.id.desc())
+            .limit(51),
+        "feed: posizione di un cursore senza posizione": select(func.count()).select_from(Item)
+            .where(Item.category == "lavoro")
+            .where(keyset >= cursor),
+        "/api/offers?cursor": select(ServiceOffer)
+            .where(ServiceOffer.status == "published")
+            .where(tuple_(ServiceOffer.created_at, ServiceOffer.id) < tuple_(datetime(2025, 1, 1), 1000))
+            .order_by(ServiceOffer.created_at.desc(), ServiceOffer.id.desc())
+            .limit(51),
+        "/api/businesses?cursor": select(LocalBusiness)
+            .where(LocalBusiness.category == "servizi")
+            .where(tuple_(LocalBusiness.created_at, LocalBusiness.id) < tuple_(datetime(2025, 1, 1), 1000))
+            .order_by(LocalBusiness.created_at.desc(), LocalBusiness.id.desc())
+            .limit(51),
+        "bot /latest": items_by_score.limit(10),
+        "bot /cat": items_by_score.where(Item.category == "lavoro").limit(10),
+    }
+
+def problems_in_plan(plan: list[str], accepted: str | None = None) -> list[str]:
+    problems = []
+    for detail in plan:
+        if FULL_SCAN.match(detail) and detail != accepted:
+            problems.append(f"scansione completa: {detail}")
+        elif "USE TEMP B-TREE" in detail:
+            problems.append(f"ordinamento senza indice: {detail}")
+    return problems
+
+def seed(db: Session, rnd: random.Random) -> None:
+    start = datetime(2024, 1, 1)
+    when = lambda: start + timedelta(minutes=rnd.randrange(60 * 24 * 730))
+    categories = ["lavoro", "bandi", "eventi", "annunci", "casa", "altro"]
+    cities = ["Fiumicino", "Roma", "Ostia", "Ladispoli", "Cerveteri"]
+    db.execute(insert(Item), [{
+        "source": f"fonte{i % 40}", "title": f"Item {i}", "url": f"https://example.it/{i}", "summary": "",
+        "category": rnd.choice(categories), "city": rnd.choice(cities), "published_at": when(),
+        "score": rnd.random() * 10, "image_url": "", "created_at": when(),
+    } for i in range(SEED_ITEMS)])
+    db.execute(insert(ServiceOffer), [{
+        "title": f"Offerta {i}", "description": "", "category": rnd.choice(categories), "contact_name": "x",
+        "contact_method": "x", "status": rnd.choice(["pending", "published", "published", "rejected"]),
+        "highlighted": rnd.random() < 0.05, "created_at": when(),
+    } for i in range(SEED_OFFERS)])
+    db.execute(insert(LocalBusiness), [{
+        "name": f"Attività {i}", "category": rnd.choice(["servizi", "negozi", "ristoranti", "artigiani"]),
+        "highlighted": rnd.random() < 0.05, "created_at": when(),
+    } for i in range(SEED_BUSINESSES)])
+    db.execute(insert(Ad), [{
+        "title": f"Ad {i}", "url": f"https://ad.example.it/{i}", "active": rnd.random() < 0.7,
+        "show_in_feed": rnd.random() < 0.8, "created_at": when(),
+    } for i in range(SEED_ADS)])
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+def check(engine=None) -> dict[str, list[str]]:
+    engine = engine or create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    with Session(engine) as db:
+        seed(db, random.Random(0))
+    report = {}
+    with Session(engine) as db:
+        for name, stmt in endpoint_queries().items():
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[3] for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+            report[name] = problems_in_plan(plan, ACCEPTED_SCANS.get(name, (None,))[0])
+    return report
+
+def main() -> int:
+    failures = 0
+    for name, problems in check().items():
+        if problems:
+            failures += 1
+            print(f"[ERR] {name}: " + "; ".join(problems))
+        elif name in ACCEPTED_SCANS:
+            print(f"[OK] {name} (scan accettato: {ACCEPTED_SCANS[name][1]})")
+        else:
+            print(f"[OK] {name}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
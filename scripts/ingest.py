@@ -1,98 +1,374 @@
-import os, json, asyncio
+import os, json, asyncio, calendar, time
 from datetime import datetime
+from typing import Callable
 from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.db import SessionLocal
-from app.models import Item
-from app.sources.crawlers import fetch_rss, fetch_html_list
-from app.ranking import classify_and_score
-from bs4 import BeautifulSoup
+from app.cache import invalidate_content
+from app.db import Base, SessionLocal, engine
+from app.metrics import Counter, Gauge, Histogram
+from app.migrations import run_migrations
+from app.models import Item, FetchState
+from app.pipeline import Stage, run_pipeline
+from app.polling import initial_interval, is_due, next_interval, next_poll_at, publish_gap
+from app.sources.crawlers import (
+    PARSE_PROCESSES, fetch_document, parse_rss_document, parse_html_document, html_to_text,
+    run_parser, close_client, shutdown_parse_pool,
+)
+from app.ranking import classify_and_score, reload_classifier
+from app.urls import normalize_url
 
 load_dotenv()
 
 CITY_DEFAULT = os.getenv("CITY", "Fiumicino")
+# Quante fonti scaricare in parallelo (il limite per host è nel client dei crawler)
+INGEST_CONCURRENCY = max(int(os.getenv("INGEST_CONCURRENCY", "8") or 8), 1)
+# Limite di parametri per singola IN (...) su SQLite
+DEDUP_CHUNK = 500
+# Righe per singola INSERT multi-riga nella fase di scrittura
+INGEST_WRITE_BATCH = max(int(os.getenv("INGEST_WRITE_BATCH", "500") or 500), 1)
+# Parsing in parallelo (uno per processo del pool) e capienza delle code tra gli stadi
+INGEST_PARSE_WORKERS = max(int(os.getenv("INGEST_PARSE_WORKERS", str(PARSE_PROCESSES or 2)) or 2), 1)
+INGEST_QUEUE_SIZE = max(int(os.getenv("INGEST_QUEUE_SIZE", "64") or 64), 1)
+
+# Metriche (app/metrics.py): nel processo del worker, o dell'API con WEB_SCHEDULER
+FETCH_SECONDS = Histogram("ingest_fetch_duration_seconds", "Durata del download per fonte", ("source",),
+                          (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0))
+FETCH_BYTES = Counter("ingest_fetch_bytes_total", "Byte scaricati per fonte", ("source",))
+FETCH_RESPONSES = Counter("ingest_fetch_responses_total", "Download per fonte e stato HTTP (unchanged = stesso hash, error = nessuna risposta)", ("source", "status"))
+ITEMS = Counter("ingest_items_total", "Item per fonte: parsed, inserted, skipped (duplicati)", ("source", "outcome"))
+CLASSIFIER_SECONDS = Histogram("classifier_duration_seconds", "Durata di classify_and_score per item", (),
+                               (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005))
+RUNS = Counter("ingest_runs_total", "Run di ingest per esito", ("outcome",))
+LAST_SUCCESS = Gauge("ingest_last_success_timestamp_seconds", "Fine dell'ultimo ingest riuscito (epoch)")
 
 def strip_html(text: str) -> str:
-    if not text:
-        return ""
-    return BeautifulSoup(text, "html.parser").get_text(separator=" ", strip=True)
+    # I parser restituiscono già testo semplice: qui di norma non si costruisce alcun albero
+    return html_to_text(text)
+
+def _existing_urls(db: Session, urls: list[str]) -> set[str]:
+    """Un'unica lookup set-based (a blocchi) invece di una SELECT per item."""
+    found: set[str] = set()
+    for start in range(0, len(urls), DEDUP_CHUNK):
+        chunk = urls[start:start + DEDUP_CHUNK]
+        found.update(row[0] for row in db.query(Item.url).filter(Item.url.in_(chunk)))
+    return found
+
+# Tipi di fonte: file di configurazione + parser del documento scaricato.
+# Un nuovo tipo si registra qui (con il suo parser) e la pipeline lo gestisce
+# senza altro codice: download, normalizzazione e scrittura sono comuni. Il
+# parser gira nel pool di processi: dev'essere una funzione di modulo e
+# restituisce (elementi, suggerimenti da salvare nello stato della fonte).
+SOURCE_TYPES: dict[str, dict] = {}
+
+def register_source_type(kind: str, config: str, parse: Callable[[dict, dict], tuple[list[dict], dict]]) -> None:
+    SOURCE_TYPES[kind] = {"config": config, "parse": parse}
+
+register_source_type("RSS", "app/sources/rss_list.json", parse_rss_document)
+register_source_type("HTML", "app/sources/html_rules.json", parse_html_document)
+
+def _load_sources() -> list[dict]:
+    sources = []
+    for kind, source_type in SOURCE_TYPES.items():
+        with open(source_type["config"], "r") as f:
+            for rule in json.load(f):
+                sources.append({"kind": kind, "name": rule["name"], "url": rule["url"], "city": rule.get("city", CITY_DEFAULT), "rule": rule})
+    return sources
+
+_schema_ready = False
+
+def _ensure_schema() -> None:
+    # Non a livello di modulo: i processi del pool di parsing reimportano questo file
+    global _schema_ready
+    if not _schema_ready:
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        _schema_ready = True
+
+def _load_fetch_state(db: Session) -> dict[str, dict]:
+    return {
+        row.source_url: {
+            "etag": row.etag, "last_modified": row.last_modified,
+            "content_hash": row.content_hash, "json_offset": row.json_offset,
+            "poll_interval": row.poll_interval, "failures": row.failures or 0, "next_poll_at": row.next_poll_at,
+        }
+        for row in db.query(FetchState).all()
+    }
+
+def _due_sources(sources: list[dict], states: dict[str, dict]) -> list[dict]:
+    now = datetime.utcnow()
+    return [src for src in sources if is_due(states.get(src["url"]), now)]
+
+def has_due_sources() -> bool:
+    """True se almeno una fonte configurata è da controllare (usato dal tick del worker)."""
+    _ensure_schema()
+    db = SessionLocal()
+    try:
+        return bool(_due_sources(_load_sources(), _load_fetch_state(db)))
+    finally:
+        db.close()
+
+def _published_dates(items: list[dict]) -> list[datetime]:
+    # feedparser dà struct_time in UTC; le fonti HTML non hanno date
+    return [datetime.utcfromtimestamp(calendar.timegm(it["published_at"])) for it in items if it.get("published_at")]
+
+def _save_fetch_state(db: Session, src: dict, changed: bool | None, new_items: int = 0, gap: float | None = None) -> None:
+    """Salva stato di cache e prossimo controllo; `changed=None` per una fonte in errore.
+
+    Per le fonti in errore si aggiornano solo i fallimenti e la prossima attesa:
+    ETag e hash restano quelli dell'ultimo download riuscito.
+    """
+    state = src.get("state", {})
+    row = db.query(FetchState).filter(FetchState.source_url == src["url"]).first()
+    if not row:
+        row = FetchState(source_url=src["url"])
+        db.add(row)
+    now = datetime.utcnow()
+    row.checked_at = now
+    if changed is None:
+        row.failures = (row.failures or 0) + 1
+        row.poll_interval = row.poll_interval or initial_interval(src["rule"])
+        row.next_poll_at = next_poll_at(src["rule"], row.poll_interval, row.failures, now)
+        return
+    row.etag = state.get("etag", "")
+    row.last_modified = state.get("last_modified", "")
+    row.content_hash = state.get("content_hash", "")
+    row.json_offset = state.get("json_offset")
+    if changed:
+        row.changed_at = now
+    row.failures = 0
+    row.poll_interval = next_interval(src["rule"], row.poll_interval, new_items, gap)
+    row.next_poll_at = next_poll_at(src["rule"], row.poll_interval, 0, now)
+
+def _normalize_items(src: dict, items: list[dict]) -> list[dict]:
+    rows = []
+    for it in items:
+        title = strip_html(it.get("title","")).strip()
+        url = normalize_url(it.get("url",""))
+        summary = strip_html(it.get("summary","")).strip()
+        location = strip_html(it.get("location","")).strip()
+        if location and location.lower() not in summary.lower():
+            summary = f"{summary} — {location}" if summary else location
+        if not title or not url:
+            continue
+        rows.append({
+            "source": src["name"],
+            "title": title,
+            "url": url,
+            "summary": summary[:1900],
+            "city": src["city"],
+            "image_url": it.get("image_url", ""),
+        })
+    return rows
+
+# Dialetti con INSERT ... ON CONFLICT DO NOTHING; gli altri scrivono una riga alla volta
+ON_CONFLICT_INSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def _insert_stmt():
+    return ON_CONFLICT_INSERT[engine.dialect.name](Item).on_conflict_do_nothing(index_elements=["url"])
+
+def _classify_new(db: Session, rows: list[dict], seen: set[str]) -> list[dict]:
+    """Scarta i duplicati (già in DB o già visti in questo run) e classifica le righe nuove."""
+    seen.update(_existing_urls(db, [r["url"] for r in rows if r["url"] not in seen]))
+    now = datetime.utcnow()
+    pending = []
+    for row in rows:
+        if row["url"] in seen:
+            continue
+        seen.add(row["url"])
+        start = time.perf_counter()
+        cls = classify_and_score(row["title"], row["summary"])
+        CLASSIFIER_SECONDS.observe(time.perf_counter() - start)
+        pending.append({**row, "category": cls["category"], "score": cls["score"], "published_at": now, "created_at": now})
+    return pending
 
-async def ingest():
+def _write_rows(db: Session, rows: list[dict]) -> list[dict]:
+    """INSERT ... ON CONFLICT(url) DO NOTHING in executemany Core (niente unit-of-work ORM per riga).
+
+    Restituisce le righe effettivamente inserite: RETURNING non riporta quelle
+    scartate dal conflitto (es. scritte da un altro processo dopo il controllo
+    dei duplicati), che quindi non si contano come nuove.
+    """
+    if engine.dialect.name not in ON_CONFLICT_INSERT or not engine.dialect.insert_executemany_returning:
+        return _write_rows_one_by_one(db, rows)
+    inserted = set(db.connection().execute(_insert_stmt().returning(Item.url), rows).scalars())
+    return [row for row in rows if row["url"] in inserted]
+
+def _write_rows_one_by_one(db: Session, rows: list[dict]) -> list[dict]:
+    """Senza ON CONFLICT: una INSERT per riga in un SAVEPOINT, così un duplicato
+    (IntegrityError sull'indice univoco di url) scarta solo la sua riga e non il batch."""
+    inserted = []
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.connection().execute(insert(Item), row)
+        except IntegrityError:
+            continue
+        inserted.append(row)
+    return inserted
+
+def _observe_fetch(src: dict, state: dict, elapsed: float, doc: dict | None) -> None:
+    status = state.get("status")
+    if status is None:
+        label = "error"
+    elif doc is None and 200 <= status < 300:
+        label = "unchanged"
+    else:
+        label = str(status)
+    FETCH_SECONDS.observe(elapsed, source=src["name"])
+    FETCH_BYTES.inc(state.get("bytes", 0), source=src["name"])
+    FETCH_RESPONSES.inc(source=src["name"], status=label)
+
+def _log_error(src: dict, error: Exception) -> None:
+    print(f"[ERR] {src['kind']} {src['name']}: {error}")
+
+async def ingest(progress: Callable[[dict], None] | None = None, due_only: bool = False) -> dict:
+    """Ingest a stadi: fetch → parse → normalize → classify → write.
+
+    Gli stadi girano in parallelo su code limitate: mentre alcune fonti si
+    scaricano, quelle già arrivate vengono analizzate, e lo scrittore
+    accumula righe di fonti diverse in batch da INGEST_WRITE_BATCH.
+    `progress`, se passato, riceve lo stato di avanzamento per fonte.
+    Con `due_only` si controllano solo le fonti il cui prossimo polling
+    (app/polling.py) è già scaduto.
+    """
+    _ensure_schema()
+    stats = {"sources": 0, "not_due": 0, "unchanged": 0, "errors": 0, "parsed": 0, "inserted": 0, "skipped": 0}
+    state_by_source = {"sources_total": 0, "sources_done": 0, "inserted": 0, "sources": {}}
     db: Session = SessionLocal()
-    # RSS
-    with open("app/sources/rss_list.json","r") as f:
-        rss_list = json.load(f)
-    for feed in rss_list:
-        url = feed["url"]
-        city = feed.get("city", CITY_DEFAULT)
+    states = _load_fetch_state(db)
+    fetched: list[tuple[dict, bool | None]] = []
+    seen: set[str] = set()
+    # Per fonte: righe nuove e distacco tra le pubblicazioni, per adattare il polling
+    new_by_source: dict[str, int] = {}
+    gap_by_source: dict[str, float | None] = {}
+    parsed_by_source: dict[str, int] = {}
+
+    def report(src: dict | None = None, outcome: str = "") -> None:
+        if src is not None:
+            state_by_source["sources_done"] += 1
+            state_by_source["sources"][src["name"]] = outcome
+        state_by_source["inserted"] = stats["inserted"]
+        if progress is not None:
+            progress(state_by_source)
+
+    async def fetch(src: dict) -> list:
+        # GET condizionale: None se la fonte non è cambiata dall'ultimo run
+        state = src["state"] = dict(states.get(src["url"], {}))
+        start, doc = time.perf_counter(), None
         try:
-            items = await fetch_rss(url)
-            for it in items:
-                title = strip_html(it.get("title","")).strip()
-                url = it.get("url","").strip()
-                summary = strip_html(it.get("summary","")).strip()
-                location = strip_html(it.get("location","")).strip()
-                if location and location.lower() not in summary.lower():
-                    summary = f"{summary} — {location}" if summary else location
-                if not title or not url:
-                    continue
-                # Check duplicate
-                exists = db.query(Item).filter(Item.url == url).first()
-                if exists:
-                    continue
-                cls = classify_and_score(title, summary)
-                row = Item(
-                    source=feed["name"],
-                    title=title,
-                    url=url,
-                    summary=summary[:1900],
-                    category=cls["category"],
-                    city=city,
-                    published_at=datetime.utcnow(),
-                    score=cls["score"],
-                    image_url=it.get("image_url", "")
-                )
-                db.add(row)
-            db.commit()
-            print(f"[OK] RSS: {feed['name']}")
-        except Exception as e:
-            print(f"[ERR] RSS {feed['name']}: {e}")
+            doc = await fetch_document(src["url"], state)
+        finally:
+            _observe_fetch(src, state, time.perf_counter() - start, doc)
+        if doc is None:
+            stats["unchanged"] += 1
+            fetched.append((src, False))
+            print(f"[=] {src['kind']}: {src['name']} (invariata)")
+            report(src, "invariata")
+            return []
+        return [(src, doc)]
+
+    async def parse(job: tuple[dict, dict]) -> list:
+        src, doc = job
+        # feedparser e BeautifulSoup sono CPU-bound: nel pool di processi, fuori dall'event loop
+        items, hints = await run_parser(SOURCE_TYPES[src["kind"]]["parse"], doc, src["rule"])
+        # Suggerimenti per il prossimo run (es. offset del JSON incorporato), salvati in fetch_state
+        src["state"].update(hints)
+        return [(src, items)]
+
+    async def normalize(job: tuple[dict, list[dict]]) -> list:
+        src, items = job
+        rows = _normalize_items(src, items)
+        gap_by_source[src["url"]] = publish_gap(_published_dates(items))
+        parsed_by_source[src["name"]] = parsed_by_source.get(src["name"], 0) + len(rows)
+        # Lo stato di cache si salva solo per le fonti arrivate fin qui
+        fetched.append((src, True))
+        print(f"[OK] {src['kind']}: {src['name']} ({len(rows)} elementi)")
+        report(src, f"{len(rows)} elementi")
+        return rows
 
-    # HTML rules
-    with open("app/sources/html_rules.json","r") as f:
-        html_rules = json.load(f)
-    for rule in html_rules:
+    async def classify(rows: list[dict]) -> list:
+        stats["parsed"] += len(rows)
+        return _classify_new(db, rows, seen)
+
+    async def write(rows: list[dict]) -> list:
+        inserted = _write_rows(db, rows)
+        stats["inserted"] += len(inserted)
+        for row in inserted:
+            new_by_source[row["source"]] = new_by_source.get(row["source"], 0) + 1
+        # Commit per batch: il lock di scrittura di SQLite si tiene per millisecondi,
+        # non per tutta la durata dell'ingest (API e avanzamento job scrivono intanto)
+        db.commit()
+        report()
+        return []
+
+    def source_error(job, error: Exception) -> None:
+        stats["errors"] += 1
+        src = job[0] if isinstance(job, tuple) else job
+        fetched.append((src, None))
+        _log_error(src, error)
+        report(src, f"errore: {error}")
+
+    stages = [
+        Stage("fetch", fetch, workers=INGEST_CONCURRENCY, on_error=source_error),
+        Stage("parse", parse, workers=INGEST_PARSE_WORKERS, on_error=source_error),
+        Stage("normalize", normalize, on_error=source_error),
+        Stage("classify", classify, batch_size=INGEST_WRITE_BATCH),
+        Stage("write", write, batch_size=INGEST_WRITE_BATCH),
+    ]
+    try:
+        # Fonti e classificatore si rileggono a ogni run: il worker resta acceso
+        # tra un run e l'altro, e KEYWORDS o CITY possono essere cambiate
+        sources = _load_sources()
+        reload_classifier()
+        if due_only:
+            due = _due_sources(sources, states)
+            stats["not_due"] = len(sources) - len(due)
+            sources = due
+        stats["sources"] = state_by_source["sources_total"] = len(sources)
+        report()
         try:
-            items = await fetch_html_list(rule["url"], rule)
-            for it in items:
-                title = strip_html(it.get("title","")).strip()
-                url = it.get("url","").strip()
-                summary = strip_html(it.get("summary","")).strip()
-                location = strip_html(it.get("location","")).strip()
-                if location and location.lower() not in summary.lower():
-                    summary = f"{summary} — {location}" if summary else location
-                if not title or not url:
-                    continue
-                exists = db.query(Item).filter(Item.url == url).first()
-                if exists:
-                    continue
-                cls = classify_and_score(title, summary)
-                row = Item(
-                    source=rule["name"],
-                    title=title,
-                    url=url,
-                    summary=summary[:1900],
-                    category=cls["category"],
-                    city=rule.get("city", CITY_DEFAULT),
-                    published_at=datetime.utcnow(),
-                    score=cls["score"],
-                    image_url=it.get("image_url", "")
-                )
-                db.add(row)
+            stats["stages"] = await run_pipeline(sources, stages, queue_size=INGEST_QUEUE_SIZE)
+            stats["skipped"] = stats["parsed"] - stats["inserted"]
+            # Lo stato di cache si salva solo a scrittura completata: se fallisce, le
+            # fonti si riscaricano e le righe già scritte le scarta ON CONFLICT(url)
+            for src, changed in fetched:
+                _save_fetch_state(db, src, changed, new_by_source.get(src["name"], 0), gap_by_source.get(src["url"]))
             db.commit()
-            print(f"[OK] HTML: {rule['name']}")
         except Exception as e:
-            print(f"[ERR] HTML {rule['name']}: {e}")
+            db.rollback()
+            stats["errors"] += 1
+            RUNS.inc(outcome="error")
+            stats["stages"] = {stage.name: stage.stats.as_dict() for stage in stages}
+            print(f"[ERR] Scrittura ingest: {e}")
+            if stats["inserted"]:
+                invalidate_content()
+            return stats
+        if stats["inserted"]:
+            invalidate_content()
+        for name, parsed in parsed_by_source.items():
+            inserted = new_by_source.get(name, 0)
+            ITEMS.inc(parsed, source=name, outcome="parsed")
+            ITEMS.inc(inserted, source=name, outcome="inserted")
+            ITEMS.inc(parsed - inserted, source=name, outcome="skipped")
+        RUNS.inc(outcome="ok")
+        LAST_SUCCESS.set(time.time())
+        for name, st in stats["stages"].items():
+            print(f"[i] {name}: {st['in']} in, {st['out']} out, {st['errors']} errori, {st['busy_s']}s attivo, {st['wall_s']}s totale")
+        print(f"[OK] Ingest: {stats['inserted']} nuovi, {stats['skipped']} scartati su {stats['parsed']}"
+              + (f" ({stats['not_due']} fonti non ancora da controllare)" if stats["not_due"] else ""))
+        return stats
+    finally:
+        db.close()
+
+async def main():
+    try:
+        await ingest()
+    finally:
+        await close_client()
+        shutdown_parse_pool()
 
 if __name__ == "__main__":
-    asyncio.run(ingest())
+    asyncio.run(main())
@@ -0,0 +1,264 @@
+"""Worker dell'ingest: polling delle fonti e coda dei job, con un solo leader.
+
+Si possono avviare più worker (o più processi web con WEB_SCHEDULER=true):
+la leadership è un lease con scadenza nella tabella `worker_leases`, rinnovato
+ogni WORKER_LEASE_TTL/3 secondi anche mentre un job è in esecuzione. Solo il
+leader fa scattare lo scheduler ed esegue i job accodati da `/admin/ingest-now`;
+se muore, un altro worker subentra alla scadenza del lease. Un leader che non
+riesce a rinnovare il lease interrompe il job in corso (chiuso come fallito)
+invece di finirlo senza più esserne il titolare. Insieme al lease si rinnova
+l'heartbeat del job: il nuovo leader chiude come falliti solo i job rimasti
+senza heartbeat per ORPHAN_AFTER secondi, cioè quelli di un worker morto.
+
+Lo scheduler non ha più un orario fisso: ogni POLL_TICK secondi accoda un
+ingest solo se qualche fonte ha il prossimo controllo scaduto, e quel job
+scarica solo quelle (frequenza per fonte in app/polling.py). L'ingest
+manuale scarica sempre tutte le fonti.
+
+Con WORKER_METRICS_PORT le metriche dell'ingest (app/metrics.py) sono
+esposte su http://0.0.0.0:<porta>/ per Prometheus.
+
+    python -m scripts.worker
+"""
+import asyncio, json, os, signal, socket, time, uuid
+from datetime import datetime, timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from dotenv import load_dotenv
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from app.db import Base, SessionLocal, engine
+from app.jobs import claim_next_job, enqueue_job, fail_orphaned_jobs, finish_job, heartbeat_job, update_progress
+from app.metrics import serve as serve_metrics
+from app.migrations import run_migrations
+from app.models import WorkerLease
+from app.sources.crawlers import close_client, shutdown_parse_pool
+from scripts.ingest import has_due_sources, ingest
+
+load_dotenv()
+
+LEASE_NAME = "ingest"
+WORKER_LEASE_TTL = max(float(os.getenv("WORKER_LEASE_TTL", "60") or 60), 3)
+# Un job `running` di un altro worker si chiude come fallito solo dopo tanto
+# tempo senza heartbeat: chi perde il lease interrompe il suo entro un TTL
+ORPHAN_AFTER = 2 * WORKER_LEASE_TTL
+# Ogni quanto il leader guarda se ci sono job in coda
+WORKER_POLL_INTERVAL = max(float(os.getenv("WORKER_POLL_INTERVAL", "5") or 5), 0.1)
+# Ogni quanto il leader guarda se qualche fonte è da controllare
+POLL_TICK = max(float(os.getenv("POLL_TICK", "60") or 60), 1)
+
+# Avanzamento dei job scritto nel DB al più una volta ogni N secondi
+JOB_PROGRESS_INTERVAL = 1.0
+# Porta HTTP delle metriche del worker (0 = disattivate)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0") or 0)
+
+async def _ingest_job(job, progress) -> dict:
+    # I job dello scheduler toccano solo le fonti scadute; quelli manuali tutte
+    return await ingest(progress=progress, due_only=job.trigger == "schedule")
+
+# Tipi di job eseguibili: funzione async(job, progress) che restituisce le statistiche
+JOB_HANDLERS = {"ingest": _ingest_job}
+
+def acquire_lease(db: Session, holder: str, ttl: float = WORKER_LEASE_TTL) -> bool:
+    """Prende o rinnova il lease; True se `holder` è il leader fino a now + ttl."""
+    now = datetime.utcnow()
+    taken = db.execute(
+        update(WorkerLease)
+        .where(WorkerLease.name == LEASE_NAME, or_(WorkerLease.holder == holder, WorkerLease.expires_at < now))
+        .values(holder=holder, expires_at=now + timedelta(seconds=ttl))
+    ).rowcount
+    if taken:
+        db.commit()
+        return True
+    if db.get(WorkerLease, LEASE_NAME) is not None:
+        db.rollback()
+        return False
+    try:
+        db.add(WorkerLease(name=LEASE_NAME, holder=holder, expires_at=now + timedelta(seconds=ttl)))
+        db.commit()
+    except IntegrityError:
+        # Un altro worker l'ha creato nello stesso istante
+        db.rollback()
+        return False
+    return True
+
+def release_lease(db: Session, holder: str) -> None:
+    db.execute(delete(WorkerLease).where(WorkerLease.name == LEASE_NAME, WorkerLease.holder == holder))
+    db.commit()
+
+def _enqueue_scheduled_ingest() -> None:
+    try:
+        if not has_due_sources():
+            return
+    except OperationalError as e:
+        print(f"[WARN] Controllo fonti da aggiornare non riuscito: {e}")
+        return
+    db = SessionLocal()
+    try:
+        job, created = enqueue_job(db, "ingest", trigger="schedule")
+        if created:
+            print(f"[OK] Ingest programmato accodato (job {job.id})")
+        else:
+            print(f"[=] Ingest programmato saltato: job {job.id} già {job.status}")
+    finally:
+        db.close()
+
+def _progress_writer(job_id: int):
+    last_write = 0.0
+
+    def write(progress: dict) -> None:
+        nonlocal last_write
+        now = time.monotonic()
+        finished = progress.get("sources_done") == progress.get("sources_total")
+        if now - last_write < JOB_PROGRESS_INTERVAL and not finished:
+            return
+        last_write = now
+        db = SessionLocal()
+        try:
+            update_progress(db, job_id, progress)
+        except OperationalError as e:
+            # L'avanzamento è informativo: un DB occupato non deve fermare il job
+            print(f"[WARN] Avanzamento job {job_id} non salvato: {e}")
+        finally:
+            db.close()
+
+    return write
+
+async def _run_job(db: Session, job) -> None:
+    print(f"[>] Job {job.id} ({job.kind}, {job.trigger})")
+    handler = JOB_HANDLERS.get(job.kind)
+    if handler is None:
+        finish_job(db, job, error=f"Tipo di job sconosciuto: {job.kind}")
+        return
+    try:
+        result = await handler(job, _progress_writer(job.id))
+    except asyncio.CancelledError:
+        # Annullato da keep_lease: il lease non è stato rinnovato
+        print(f"[WARN] Job {job.id} interrotto: leadership persa")
+        finish_job(db, job, error="Interrotto: il worker ha perso la leadership durante l'esecuzione")
+        raise
+    except Exception as e:
+        print(f"[ERR] Job {job.id}: {e}")
+        finish_job(db, job, error=str(e))
+        return
+    finish_job(db, job, result=result)
+    print(f"[OK] Job {job.id} completato: {json.dumps(result, default=str)[:200]}")
+
+async def run_worker(stop: asyncio.Event | None = None) -> None:
+    stop = stop or asyncio.Event()
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    leader = asyncio.Event()
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(
+        _enqueue_scheduled_ingest,
+        trigger=IntervalTrigger(seconds=POLL_TICK),
+        id="poll_sources",
+        replace_existing=True,
+    )
+    scheduler.start(paused=True)
+    # Job in esecuzione: keep_lease ne rinnova l'heartbeat, o lo annulla se il lease non si rinnova
+    job_task: asyncio.Task | None = None
+    job_id: int | None = None
+
+    def stop_job() -> None:
+        if job_task is not None and not job_task.done():
+            job_task.cancel()
+
+    def lose_leadership(reason: str) -> None:
+        print(f"[WARN] Worker {holder}: {reason}")
+        leader.clear()
+        scheduler.pause()
+        stop_job()
+
+    async def keep_lease() -> None:
+        leader_until = 0.0
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            db = SessionLocal()
+            try:
+                if acquire_lease(db, holder):
+                    leader_until = loop.time() + WORKER_LEASE_TTL
+                    if job_id is not None and not heartbeat_job(db, job_id, holder):
+                        print(f"[WARN] Job {job_id} chiuso da un altro worker: interrotto")
+                        stop_job()
+                    # Anche dopo il subentro: il job del leader precedente si chiude solo se il suo heartbeat è fermo
+                    orphaned = fail_orphaned_jobs(db, holder, datetime.utcnow() - timedelta(seconds=ORPHAN_AFTER))
+                    if not leader.is_set():
+                        print(f"[OK] Worker {holder} è leader" + (f" ({orphaned} job interrotti chiusi)" if orphaned else ""))
+                        leader.set()
+                        scheduler.resume()
+                    elif orphaned:
+                        print(f"[OK] {orphaned} job interrotti chiusi")
+                elif leader.is_set():
+                    lose_leadership("leadership persa")
+            except OperationalError as e:
+                # DB occupato (es. commit lungo dell'ingest): si resta leader finché il lease non scade
+                if leader.is_set() and loop.time() >= leader_until:
+                    lose_leadership(f"lease non rinnovato ({e})")
+            finally:
+                db.close()
+            try:
+                await asyncio.wait_for(stop.wait(), WORKER_LEASE_TTL / 3)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_jobs() -> None:
+        nonlocal job_task, job_id
+        while not stop.is_set():
+            job = None
+            if leader.is_set():
+                db = SessionLocal()
+                try:
+                    job = claim_next_job(db, holder)
+                    if job is not None:
+                        job_id = job.id
+                        job_task = asyncio.create_task(_run_job(db, job))
+                        await asyncio.wait({job_task})
+                        if not job_task.cancelled():
+                            job_task.result()
+                except OperationalError as e:
+                    print(f"[WARN] Coda job non disponibile: {e}")
+                finally:
+                    if job_task is not None and not job_task.done():
+                        # run_jobs annullato: il job si chiude prima della sessione che usa
+                        job_task.cancel()
+                        await asyncio.wait({job_task})
+                    job_task = job_id = None
+                    db.close()
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    try:
+        await asyncio.gather(keep_lease(), run_jobs())
+    finally:
+        scheduler.shutdown(wait=False)
+        db = SessionLocal()
+        try:
+            release_lease(db, holder)
+        finally:
+            db.close()
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    if WORKER_METRICS_PORT:
+        serve_metrics(WORKER_METRICS_PORT)
+    print(f"✅ Worker avviato - fonti controllate ogni {POLL_TICK:g}s se scadute"
+          + (f", metriche sulla porta {WORKER_METRICS_PORT}" if WORKER_METRICS_PORT else ""))
+    try:
+        await run_worker(stop)
+    finally:
+        await close_client()
+        shutdown_parse_pool()
+        print("❌ Worker fermato")
+
+if __name__ == "__main__":
+    asyncio.run(main())